@@ -1,92 +1,644 @@
 from colorama import Fore, Back, Style
+import asyncio
 import datetime
+import functools
+import itertools
+import math
 import os
+import re
+import select
 import sys
 
+import bisect
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
-from collections import defaultdict
-from .Log import Log
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import defaultdict, namedtuple
+from .FoamDict import file_keys, parse_file
+from .segments import is_rotated_segment
+from .Log import FILE_POOL, LOG_PATTERNS, Log, compile_log_patterns, is_utility, peek_exec
+from .watcher import get_watcher
 from .header import foamMonHeader
+from .stats import STATS
 
 
-default_elements = ["progressbar", "folder", "logfile", "time", "writeout", "remaining"]
+default_elements = ["progressbar", "folder", "logfile", "time", "writeout", "remaining",
+                    "speed", "eta_range", "courant", "deltaT", "residual"]
+
+# seconds between two snapshots of the case statuses
+SNAPSHOT_INTERVAL = 1.0
+# bounds of the adaptive snapshot interval
+MIN_SNAPSHOT_INTERVAL = 0.2
+MAX_SNAPSHOT_INTERVAL = 5.0
+# a case without watcher events is polled again after this fraction of the
+# time since its log last grew, thus growing logs are polled on every snapshot
+POLL_BACKOFF = 0.1
+MAX_POLL_INTERVAL = 60
+# seconds between two polls of finished cases and of logs idle for IDLE_TIMEOUT
+IDLE_POLL_INTERVAL = 300
+IDLE_TIMEOUT = 3600
+# seconds between two periodic searches for new cases
+RESCAN_INTERVAL = 10
+# seconds between two polls of watched cases and two searches for new cases
+# of watched directories, in case events got lost
+WATCHED_POLL_INTERVAL = 120
+WATCHED_RESCAN_INTERVAL = 600
+# max number of cases refreshed concurrently
+REFRESH_WORKERS = 8
+# max seconds get_valid_cases waits for refreshing cases
+REFRESH_TIMEOUT = 0.5
+# number of recent History samples the sim speed is fitted over, one per
+# change of the ClockTime
+SPEED_WINDOW = 50
+# width of the progress bar in characters
+PROGRESS_DIGITS = 50
+# width of the ETA range in standard errors of the fitted sim speed
+ETA_SIGMAS = 2
+
+PROCESSOR_DIR_RE = re.compile(r"processors?[0-9]+(_[0-9]+-[0-9]+)?$")
+
+# directory prefixes which are never searched for cases
+IGNORE_DIRS = (
+    "boundaryData",
+    "uniform",
+    "processor",
+    "constant",
+    "TDAC",
+    "lagrangian",
+    "postProcessing",
+    "dynamicCode",
+    "system",
+    "VTK",
+)
+
+
+# immutable state of all cases handed from the producer thread to the UI,
+# case_stats maps folders to {"active": (Status, ...), "inactive": (...)}
+Snapshot = namedtuple("Snapshot", ["version", "lengths", "case_stats"])
+
+
+def memoized_property(func):
+    """ a property which is evaluated at most once per refresh generation
+    of a case, see Case.refresh """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self):
+        try:
+            return self.memo[name]
+        except KeyError:
+            value = self.memo[name] = func(self)
+            return value
+    return property(wrapper)
+
+
+def format_value(value):
+    """ short representation of an optional float """
+    if value is None:
+        return "-"
+    return "{:.3g}".format(value)
+
+
+def is_time_dir(name):
+    """ returns True if name is a time step directory, e.g. 0.0125 """
+    try:
+        return math.isfinite(float(name))
+    except ValueError:
+        return False
+
+
+def is_processor_dir(name):
+    """ returns True for processor<N> and collated processors<N>[_<a>-<b>] """
+    return bool(PROCESSOR_DIR_RE.match(name))
 
 
 class Cases():
 
-    def __init__(self, paths):
+    def __init__(self, paths, watcher="auto", background=True, cache=None,
+                 speed_window=SPEED_WINDOW, filters=None, log_patterns=LOG_PATTERNS):
         self.paths = paths
+        self.log_format = compile_log_patterns(log_patterns)
+        self.speed_window = speed_window
+        # CustomFilters shared by the logs of all cases
+        self.filters = filters
         self.cases = defaultdict(list)
+        # path -> (mtime, subdirectories) of every visited directory
+        self.dir_cache = {}
+        self.known_cases = set()
+
+        self.watcher = get_watcher(watcher)
+        # watched directory -> case path, for case and processor0 directories
+        self.case_dirs = {}
+        # cases which need a refresh or can not be watched
+        self.dirty = set()
+        self.polled = set()
+        # directories which could not be watched during discovery
+        self.unwatched = set()
+        self.rescan = False
+        # called from any thread if a rescan has been requested
+        self.on_rescan = None
+        # called from any thread if the next snapshot should not wait,
+        # e.g. after new cases were found
+        self.on_change = None
+        # wakes the background threads on rescan requests and on stop
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        # case path -> latest completed Status
+        self.statuses = {}
+        # widths and active flags of self.statuses
+        self.columns = StatusColumns()
+        # cases and case_stats of the last get_valid_cases, reused
+        # as long as no status changed
+        self.last_cases = None
+        self.case_stats = {}
+        # case path -> future of a running refresh
+        self.pending = {}
+        # case path -> time of the next poll, see Case.poll_interval
+        self.next_poll = {}
+        self.refresh_pool = ThreadPoolExecutor(REFRESH_WORKERS)
+
+        # protects self.cases and the watched directories which are
+        # modified by the discovery thread
+        self.lock = threading.Lock()
+        self.snapshot = Snapshot(0, {element: 0 for element in default_elements}, {})
+        # number of statuses which changed during the last get_valid_cases
+        self.changed = 0
+
+        self.cache = cache
+        if self.cache is not None:
+            self.restore()
 
         self.running = True
+        if not background:
+            # discovery and snapshots are driven by the caller,
+            # e.g. by discover_async and produce_async
+            return
+
         def worker():
             while self.running:
+                self.rescan = False
+                self.wakeup.clear()
                 self.find_cases()
-                for i in range(10):
-                    if not self.running:
-                        return
-                    time.sleep(1)
-        self.p = ThreadPoolExecutor(1)
+                self.wakeup.wait(self.rescan_interval)
+
+        # pipe written by notify to end the wait of the producer
+        wake_r, wake_w = os.pipe()
+        os.set_blocking(wake_r, False)
+        os.set_blocking(wake_w, False)
+
+        def on_change():
+            try:
+                os.write(wake_w, b"\0")
+            except OSError:
+                # pipe full, the producer is woken anyway, or closed
+                pass
+        self.on_change = on_change
+
+        def producer():
+            interval = SNAPSHOT_INTERVAL
+            version = None
+            try:
+                while self.running:
+                    start = time.time()
+                    snapshot = self.produce_snapshot()
+                    interval = self.next_snapshot_interval(
+                            interval, snapshot.version != version)
+                    version = snapshot.version
+                    self.wait_for_changes(
+                            wake_r, max(0, interval - (time.time() - start)))
+            finally:
+                self.on_change = None
+                os.close(wake_r)
+                os.close(wake_w)
+
+        self.p = ThreadPoolExecutor(2)
         self.future = self.p.submit(worker)
+        self.producer = self.p.submit(producer)
+
+    def restore(self):
+        """ restore the directories, cases, log offsets and log Execs of the
+        last run from the persistent cache, the cases are validated by their
+        first refresh in the refresh pool """
+        dir_cache, cases, log_records, log_execs = self.cache.load(self.paths)
+        self.dir_cache.update(dir_cache)
+        execs = defaultdict(dict)
+        for fn, exec_ in log_execs.items():
+            execs[os.path.dirname(fn)][fn] = exec_
+        # same order as find_cases would add them
+        for path in sorted(cases, reverse=True):
+            log = cases[path]
+            c = Case(path, log_records={log: log_records[log]}
+                     if log in log_records else None,
+                     log_execs=execs.get(path), lazy=True,
+                     speed_window=self.speed_window, filters=self.filters,
+                     log_format=self.log_format)
+            with self.lock:
+                self.known_cases.add(c.path)
+                self.watch_case(c)
+                self.cases[os.path.dirname(path)].append(c)
+
+    def save(self):
+        """ store the current state in the persistent cache """
+        if self.cache is None:
+            return
+        with self.lock:
+            cases = [c for cs in self.cases.values() for c in cs]
+        self.cache.save(self.paths, dict(self.dir_cache), cases)
+
+    def produce_snapshot(self):
+        """ collect the statuses of all cases into a new snapshot """
+        lengths, case_stats = self.get_valid_cases()
+        if (case_stats == self.snapshot.case_stats
+                and lengths == self.snapshot.lengths):
+            # keep the version, so the UI can skip the update
+            return self.snapshot
+        self.snapshot = Snapshot(self.snapshot.version + 1, lengths, case_stats)
+        return self.snapshot
+
+    def latest_snapshot(self):
+        """ returns the latest completed snapshot, never blocks """
+        return self.snapshot
+
+    def request_rescan(self):
+        self.rescan = True
+        self.wakeup.set()
+
+    def notify(self):
+        """ take the next snapshot without waiting for the interval """
+        on_change = self.on_change
+        if on_change is not None:
+            on_change()
+
+    def wait_for_changes(self, wake_fd, timeout):
+        """ wait up to timeout seconds until notify is called or the
+        watcher has events, but at least MIN_SNAPSHOT_INTERVAL """
+        self.stopped.wait(min(timeout, MIN_SNAPSHOT_INTERVAL))
+        fds = [wake_fd]
+        fd = getattr(self.watcher, "fd", None)
+        if fd is not None and fd >= 0:
+            fds.append(fd)
+        try:
+            select.select(fds, [], [], max(0, timeout - MIN_SNAPSHOT_INTERVAL))
+        except (OSError, ValueError):
+            # watcher closed by stop
+            return
+        try:
+            while os.read(wake_fd, 4096):
+                pass
+        except OSError:
+            pass
+        if self.on_rescan is not None:
+            self.on_rescan()
+
+    async def discover_async(self, executor):
+        """ asyncio task running find_cases in executor, waits for rescan
+        requests instead of polling """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        self.on_rescan = lambda: loop.call_soon_threadsafe(wakeup.set)
+        while self.running:
+            wakeup.clear()
+            self.rescan = False
+            await loop.run_in_executor(executor, self.find_cases)
+            timeout = self.rescan_interval
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def produce_async(self, executor, on_snapshot=None):
+        """ asyncio task producing snapshots in executor
+
+        The interval between snapshots is halved while snapshots change and
+        doubled while they do not, within MIN_SNAPSHOT_INTERVAL and
+        MAX_SNAPSHOT_INTERVAL. Watcher events and new cases end the wait
+        early.
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        self.on_change = lambda: loop.call_soon_threadsafe(wakeup.set)
+        fd = getattr(self.watcher, "fd", None)
+
+        def on_event():
+            # the reader is level triggered, remove it until the events
+            # have been consumed by the next snapshot
+            loop.remove_reader(fd)
+            wakeup.set()
+
+        interval = SNAPSHOT_INTERVAL
+        version = None
+        while self.running:
+            wakeup.clear()
+            snapshot = await loop.run_in_executor(executor, self.produce_snapshot)
+            if on_snapshot is not None:
+                on_snapshot(snapshot)
+
+            interval = self.next_snapshot_interval(
+                    interval, snapshot.version != version)
+            version = snapshot.version
+
+            await asyncio.sleep(MIN_SNAPSHOT_INTERVAL)
+            if fd is not None:
+                loop.add_reader(fd, on_event)
+            try:
+                await asyncio.wait_for(wakeup.wait(),
+                                       interval - MIN_SNAPSHOT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            if fd is not None:
+                loop.remove_reader(fd)
+
+    @staticmethod
+    def next_snapshot_interval(interval, changed):
+        """ the interval is halved after a snapshot changed and doubled
+        after it did not, within MIN_SNAPSHOT_INTERVAL and
+        MAX_SNAPSHOT_INTERVAL """
+        if changed:
+            return max(MIN_SNAPSHOT_INTERVAL, interval / 2)
+        return min(MAX_SNAPSHOT_INTERVAL, interval * 2)
 
-    def get_valid_cases(self):
+    @property
+    def needs_rescan(self):
+        """ event driven discovery only needs periodic rescans if some
+        directories could not be watched """
+        return not self.watcher.event_driven or bool(self.unwatched)
+
+    @property
+    def rescan_interval(self):
+        """ seconds between two periodic runs of find_cases """
+        return RESCAN_INTERVAL if self.needs_rescan else WATCHED_RESCAN_INTERVAL
+
+    @STATS.timed("refresh cases")
+    def get_valid_cases(self, timeout=REFRESH_TIMEOUT):
+        """ refresh the cases in the refresh pool and return the latest
+        completed statuses
+
+        Waits at most timeout seconds for the refreshes, cases which take
+        longer, e.g. due to a hung filesystem, keep their previous status
+        and are not resubmitted until their refresh is done. With timeout
+        None all refreshes are awaited.
+        """
+        self.handle_events()
+        with self.lock:
+            cases = [(r, tuple(cs)) for r, cs in sorted(self.cases.items())]
+        for r, cs in cases:
+            for c in cs:
+                if c.path in self.pending:
+                    continue
+                if c.path not in self.statuses or self.needs_refresh(c.path):
+                    self.dirty.discard(c.path)
+                    STATS.count("case refreshes")
+                    self.pending[c.path] = self.refresh_pool.submit(
+                        self.refresh_case, c)
+
+        wait(list(self.pending.values()), timeout=timeout)
+
+        self.changed = 0
+        for path, future in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[path]
+            try:
+                status = future.result()
+                if status is None:
+                    # restored case which is no longer valid
+                    self.drop_case(path)
+                    continue
+                interval = status.case.poll_interval()
+                if self.is_watched(path):
+                    interval = max(interval, WATCHED_POLL_INTERVAL)
+                self.next_poll[path] = time.time() + interval
+            except Exception:
+                # keep the previous status, e.g. if the log vanished
+                continue
+            if status != self.statuses.get(path):
+                # unchanged statuses are kept, so the UI can compare by identity
+                self.changed += 1
+                self.set_status(path, status)
+
+        # only active cases can become inactive without a refresh
+        for path in self.columns.active_paths():
+            status = self.statuses[path]
+            if path not in self.pending and not status.case.log.active:
+                self.set_status(path, status.case.get_status())
+                self.changed += 1
+
+        if self.changed or cases != self.last_cases:
+            self.last_cases = cases
+            self.case_stats = self.group_statuses(cases)
+        return self.columns.lengths(), self.case_stats
+
+    def set_status(self, path, status):
+        self.statuses[path] = status
+        self.columns.update(path, status)
+
+    def group_statuses(self, cases):
+        """ returns the active and inactive statuses per folder of cases,
+        statuses of cases which are no longer known are dropped """
         case_stats = {}
-        for r, cs in sorted(self.cases.items()):
+        paths = set()
+        for r, cs in cases:
+            active, inactive = [], []
             for c in cs:
-                c.refresh()
+                status = self.statuses.get(c.path)
+                if status is None:
+                    continue
+                paths.add(c.path)
+                if status.active:
+                    active.append(status)
+                else:
+                    inactive.append(status)
             case_stats[r] = {
-                "active": [c.get_status() for c in cs if c.log.active],
-                "inactive": [c.get_status() for c in cs if not c.log.active],
+                "active": tuple(active),
+                "inactive": tuple(inactive),
             }
-        lengths = self.get_max_lengths(case_stats)
-        return lengths, case_stats
+        for path in [p for p in self.statuses if p not in paths and p not in self.pending]:
+            del self.statuses[path]
+            self.columns.remove(path)
+        return case_stats
+
+    def refresh_case(self, c):
+        """ runs in the refresh pool, returns None if a case restored from
+        the cache turns out to be invalid """
+        c.refresh()
+        if c.path not in self.statuses and not c.is_valid:
+            return None
+        return c.get_status()
+
+    def drop_case(self, path):
+        """ forget an invalid case, find_cases checks the directory again """
+        with self.lock:
+            self.known_cases.discard(path)
+            r = os.path.dirname(path)
+            self.cases[r] = [c for c in self.cases[r] if c.path != path]
+            if not self.cases[r]:
+                del self.cases[r]
+            for d in [d for d, p in self.case_dirs.items() if p == path]:
+                del self.case_dirs[d]
+            self.dir_cache.pop(path, None)
+        self.polled.discard(path)
+        self.next_poll.pop(path, None)
+        self.request_rescan()
+
+    def stop(self):
+        self.running = False
+        self.stopped.set()
+        self.wakeup.set()
+        self.notify()
+        self.save()
+        self.watcher.close()
+        self.refresh_pool.shutdown(wait=False)
+        FILE_POOL.close()
+
+    def is_watched(self, path):
+        return self.watcher.event_driven and path not in self.polled
+
+    def needs_refresh(self, path):
+        """ watched cases are refreshed on events and every
+        WATCHED_POLL_INTERVAL, others when their next poll is due """
+        if path in self.dirty:
+            return True
+        return time.time() >= self.next_poll.get(path, 0)
 
-    def get_max_lengths(self, statuses):
+    def watch_case(self, c):
+        """ watch the case directory for log changes and new time steps,
+        must be called with self.lock held """
+        for d in [c.path, os.path.join(c.path, "processor0")]:
+            STATS.count("stat calls")
+            if not os.path.isdir(d):
+                continue
+            if self.watcher.watch(d):
+                self.case_dirs[d] = c.path
+            else:
+                self.polled.add(c.path)
+
+    def handle_events(self):
+        """ translate watcher events into dirty cases and rescans """
+        for event in self.watcher.events():
+            if event.kind == "overflow":
+                with self.lock:
+                    self.dirty.update(self.known_cases)
+                self.request_rescan()
+                continue
+
+            with self.lock:
+                case_path = self.case_dirs.get(event.path)
+            if case_path is not None:
+                # log appended, new log or new time step directory
+                self.dirty.add(case_path)
+                if (event.kind == "created" and event.is_dir
+                        and event.name == "processor0"):
+                    d = os.path.join(event.path, event.name)
+                    if self.watcher.watch(d):
+                        with self.lock:
+                            self.case_dirs[d] = case_path
+                continue
+
+            if event.kind != "modified":
+                # new or removed case candidate
+                self.request_rescan()
+
+    @staticmethod
+    def get_max_lengths(statuses):
         lengths = {element: 0 for element in default_elements}
         for n, folder in statuses.items():
             for s in folder.get("active", []):
                 for elem in lengths.keys():
-                    lengths[elem] = max(lengths[elem], s.lengths[elem])
+                    lengths[elem] = max(lengths[elem], s.length(elem))
 
             for s in folder.get("inactive", []):
                 for elem in lengths.keys():
-                    lengths[elem] = max(lengths[elem], s.lengths[elem])
+                    lengths[elem] = max(lengths[elem], s.length(elem))
         return lengths
 
+    @STATS.timed("discovery")
     def find_cases(self):
+        """ incrementally discover cases below self.paths
+
+        Directory listings are cached together with the directory mtime,
+        unchanged directories are not listed again and only the subdirectories
+        known from the cache are visited. Time step directories and known
+        cases are never descended into.
+        """
         for path in self.paths:
-            for r, dirs, _ in os.walk(path):
-                dirs.sort(reverse=True)
-
-                ignore = [
-                    "boundaryData",
-                    "uniform",
-                    "processor",
-                    "constant",
-                    "TDAC",
-                    "lagrangian",
-                    "postProcessing",
-                    "dynamicCode",
-                    "system",
-                    "VTK",
-                ]
-
-                for d in dirs[:]:
-                    for i in ignore:
-                        if d.startswith(i):
-                            dirs.remove(d)
-
-                for d in dirs:
-                    c = Case(os.path.join(r, d))
-                    if c.is_valid:
-                        exists = False
-                        for existing in self.cases[r]:
-                            if c.path == existing.path:
-                                exists = True
-                        if not exists:
-                            self.cases[r].append(c)
+            stack = [(path, False)]
+            while stack:
+                r, is_link = stack.pop()
+                STATS.count("stat calls")
+                try:
+                    mtime = os.stat(r).st_mtime
+                except OSError:
+                    self.dir_cache.pop(r, None)
+                    self.unwatched.discard(r)
+                    continue
+
+                cached = self.dir_cache.get(r)
+                if not self.watcher.is_watched(r):
+                    if self.watcher.watch(r):
+                        self.unwatched.discard(r)
+                    else:
+                        self.unwatched.add(r)
+
+                if cached and cached[0] == mtime:
+                    dirs = cached[1]
+                else:
+                    dirs, has_system = self.list_dirs(r)
+                    self.dir_cache[r] = (mtime, dirs)
+                    if r != path and has_system and self.add_case(r):
+                        continue
+
+                # like os.walk symlinks are checked but never followed
+                if is_link:
+                    continue
+
+                # pushed in ascending order, so visited in descending order
+                for d, link in dirs:
+                    d = os.path.join(r, d)
+                    if d not in self.known_cases:
+                        stack.append((d, link))
+
+    @staticmethod
+    def list_dirs(path):
+        """ returns the sorted (name, is_symlink) tuples of subdirectories
+        which can contain cases and whether path has a system folder """
+        dirs = []
+        has_system = False
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return dirs, has_system
+        STATS.count("dirs listed")
+        for entry in entries:
+            try:
+                if not entry.is_dir():
+                    continue
+            except OSError:
+                continue
+            if entry.name == "system":
+                has_system = True
+            if entry.name.startswith(IGNORE_DIRS):
+                continue
+            dirs.append((entry.name, entry.is_symlink()))
+        if has_system:
+            # time step directories only exist within case directories
+            dirs = [d for d in dirs if not is_time_dir(d[0])]
+        dirs.sort()
+        return dirs, has_system
 
+    def add_case(self, path):
+        """ construct a Case for a new candidate path,
+        returns True if it is a valid case """
+        c = Case(path, speed_window=self.speed_window, filters=self.filters,
+                 log_format=self.log_format)
+        if not c.is_valid:
+            return False
+        with self.lock:
+            self.known_cases.add(c.path)
+            self.watch_case(c)
+            self.cases[os.path.dirname(path)].append(c)
+        self.notify()
+        return True
 
     # def print_header(self, lengths):
     #     width_progress = lengths[0]
@@ -124,13 +676,33 @@ class Cases():
 
 class Case():
 
-    def __init__(self, path, log_format="log", summary=False, log_filter=None):
+    def __init__(self, path, log_format=None, summary=False, log_filter=None, log_records=None,
+                 speed_window=SPEED_WINDOW, filters=None, log_execs=None, lazy=False):
         self.path = path
+        self.speed_window = speed_window
+        self.filters = filters
         self.folder = os.path.basename(self.path)
-        self.log_format = log_format
+        # regex of log file names, see compile_log_patterns
+        self.log_format = log_format or compile_log_patterns(LOG_PATTERNS)
+        # names of the logs and the mtime of the case directory they belong to
+        self.log_names = None
+        self.log_dir_mtime = None
+        # log path -> (inode, size, Exec) of the candidate logs
+        self.log_execs = log_execs or {}
         self.log_filter = log_filter
+        # log path -> record of the persistent cache to resume from
+        self.log_records = log_records or {}
 
         self.log = None
+        # log path -> Log, logs are kept if the most recent log changes
+        self.logs = {}
+        # cached derived properties and the generation they belong to
+        self.memo = {}
+        self.generation = None
+        self.write_times = WriteTimes(self.path)
+        if lazy:
+            # refreshed later, e.g. in the refresh pool
+            return
         self.refresh()
 
         if summary and self.log.active:
@@ -138,16 +710,54 @@ class Case():
             if ret:
                 print(ret)
 
+    @STATS.timed("case refresh")
     def refresh(self):
+        STATS.count("stat calls")
         if os.path.exists(self.path):
-            log_fns = list(self.find_logs(self.log_format))
+            log_fns = self.find_logs()
             if log_fns:
-                current_log_fn = self.find_recent_log_fn(log_fns)
+                current_log_fn = self.select_log(log_fns)
                 if self.log is None or self.log.path != current_log_fn:
-                    self.log = Log(current_log_fn)
+                    self.log = self.logs.get(current_log_fn)
+                    if self.log is None:
+                        self.log = self.logs[current_log_fn] = Log(
+                                current_log_fn,
+                                self.log_records.pop(current_log_fn, None),
+                                self.filters)
                 self.log.refresh()
+                if len(self.logs) > 1:
+                    # forget removed logs
+                    paths = {fn for fn, _ in log_fns}
+                    for fn in [fn for fn in self.logs if fn not in paths]:
+                        del self.logs[fn]
         else:
             self.log = None
+        self.write_times.refresh()
+        self.invalidate()
+
+    def poll_interval(self):
+        """ seconds until the case needs to be polled again without
+        watcher events, grows with the time since the log last grew """
+        if self.log is None:
+            return IDLE_POLL_INTERVAL
+        idle = time.time() - self.log.mtime
+        if idle > IDLE_TIMEOUT or (self.progress >= 1 and not self.log.active):
+            return IDLE_POLL_INTERVAL
+        return min(MAX_POLL_INTERVAL, POLL_BACKOFF * idle)
+
+    def invalidate(self):
+        """ drop memoized properties if the log, controlDict or one of the
+        files included by controlDict changed """
+        controlDict = file_keys(self.controlDict_file)
+        written = (self.write_times.latest, self.write_times.latest_complete)
+        if self.log is not None:
+            generation = (self.log.path, self.log.inode, self.log.offset,
+                          self.log.mtime, controlDict, written)
+        else:
+            generation = (None, controlDict, written)
+        if generation != self.generation:
+            self.memo.clear()
+            self.generation = generation
 
     @property
     def is_valid(self):
@@ -159,96 +769,114 @@ class Case():
 
     @property
     def has_controlDict(self):
+        STATS.count("stat calls")
         return os.path.exists(self.controlDict_file)
 
-    def custom_filter_value(self, regex):
-        return self.log.get_latest_value(regex, self.log.cached_body)
+    def custom_filter_value(self, name):
+        """ latest value of the custom filter name, kept after the
+        matching line left the cached tail, None if it never matched """
+        return self.log.state.custom.get(name)
 
-    def find_logs(self, log_format):
-        """ returns a list of filenames and mtimes """
-        for entry in os.scandir(self.path):
-            # TODO use regex to find logs
-            if log_format not in entry.name:
+    def find_logs(self):
+        """ returns a list of (path, stat) of the logs, the directory is
+        only listed again after its mtime changed """
+        STATS.count("stat calls")
+        mtime = os.stat(self.path).st_mtime
+        if self.log_names is None or mtime != self.log_dir_mtime:
+            STATS.count("dirs listed")
+            names = [entry.name for entry in os.scandir(self.path)
+                     if self.log_format.fullmatch(entry.name)
+                     and entry.is_file()]
+            # rotated segments are read as part of their log
+            self.log_names = [name for name in names
+                              if not is_rotated_segment(name, names)]
+            self.log_dir_mtime = mtime
+            for fn in set(self.log_execs) - {os.path.join(self.path, n) for n in self.log_names}:
+                del self.log_execs[fn]
+        logs = []
+        for name in self.log_names:
+            fn = os.path.join(self.path, name)
+            STATS.count("stat calls")
+            try:
+                logs.append((fn, os.stat(fn)))
+            except FileNotFoundError:
                 continue
-            yield entry.path, entry.stat().st_mtime
+        return logs
+
+    def log_exec(self, fn, stat):
+        """ the Exec of a log, remembered per inode, a missing Exec is
+        only looked up again after the log has grown """
+        cached = self.log_execs.get(fn)
+        if cached is not None and cached[0] == stat.st_ino:
+            if cached[2] is not None or cached[1] == stat.st_size:
+                return cached[2]
+        exec_ = peek_exec(fn)
+        self.log_execs[fn] = (stat.st_ino, stat.st_size, exec_)
+        return exec_
+
+    def select_log(self, log_fns):
+        """ returns the most recent solver log, i.e. not written by a utility
+        like blockMesh, then the most recent log without Exec, e.g. if
+        the header has not been written yet, then the most recent log """
+        log_fns = sorted(log_fns, key=lambda l: l[1].st_mtime, reverse=True)
+        execs = [self.log_exec(fn, stat) for fn, stat in log_fns]
+        for (fn, _), exec_ in zip(log_fns, execs):
+            if exec_ and not is_utility(exec_):
+                return fn
+        for (fn, _), exec_ in zip(log_fns, execs):
+            if exec_ is None:
+                return fn
+        return log_fns[0][0]
 
     @property
     def is_parallel(self):
-        return os.path.exists(os.path.join(self.path, "processor0"))
+        return bool(self.write_times.processors)
 
     @property
     def last_timestep_ondisk(self):
-        if self.is_parallel:
-            proc_dir = os.path.join(self.path, "processor0")
-            r, ds, _ = next(os.walk(proc_dir))
-            rems = [ "constant",
-                    "TDAC"]
-            for rem in rems:
-                if rem in ds:
-                    ds.remove(rem)
-
-            ds = [float(d) for d in ds]
-            if ds:
-                return max(ds)
-            else:
-                return 0
-        else:
-            ts = []
-            r, ds, _ = next(os.walk(self.path))
-            for t in ds:
-                try:
-                    tsf = float(t)
-                    ts.append(tsf)
-                except:
-                    pass
-            if ts:
-                return max(ts)
-            else:
-                return 0
+        return self.write_times.latest
 
-    @staticmethod
-    def find_recent_log_fn(log_fns):
-        files, mtimes = zip(*log_fns)
-        latest_index = mtimes.index(max(mtimes))
-        return files[latest_index]
+    @property
+    def last_complete_timestep_ondisk(self):
+        """ latest time step which has been written by all processors """
+        return self.write_times.latest_complete
+
+    @property
+    def last_timestep_complete(self):
+        """ True if the latest time step on disk exists in all processor
+        directories """
+        return self.write_times.is_complete
 
     @property
     def controlDict_file(self):
         return os.path.join(self.path, "system/controlDict")
 
     def get_key_controlDict(self, key):
-        """ find given key in controlDict """
-        # TODO cach controlDict to avoid reopening file
-        separator = " "
-        key += separator
-        try:
-            with open(self.controlDict_file) as f:
-                for i, line in enumerate(f.readlines()):
-                    if key in line:
-                        # TODO use regex to sanitise
-                        return (line.replace(key, '')
-                                .replace(' ', '')
-                                .replace(';', '')
-                                .replace('\n', ''))
-        except FileNotFoundError:
+        """ find given top level key in controlDict """
+        controlDict = parse_file(self.controlDict_file)
+        if controlDict is None:
             return None
+        value = controlDict.get(key)
+        if isinstance(value, str):
+            return value
+        return None
 
     def get_float_controlDict(self, key):
         ret = self.get_key_controlDict(key)
-        if ret:
+        try:
             return float(ret)
-        else:
+        except (TypeError, ValueError):
             return 0
 
-    @property
+    @memoized_property
     def endTime(self):
         return self.get_float_controlDict("endTime")
 
-    @property
+    @memoized_property
     def writeControl(self):
         return self.get_key_controlDict("writeControl")
 
-    @property
+    @memoized_property
     def writeInterval(self):
         if self.writeControl == "runTime" or self.writeControl == "adjustableRunTime":
             return self.get_float_controlDict("writeInterval")
@@ -256,64 +884,98 @@ class Case():
             return (self.get_float_controlDict("writeInterval") *
                     self.get_float_controlDict("deltaT"))
 
-    @property
+    @memoized_property
     def startSampling(self):
         return self.get_float_controlDict("startTime")
 
-    @property
+    @memoized_property
     def startSamplingPerc(self):
         if self.endTime == 0:
             return 0
         return self.startSampling / self.endTime
 
-    @property
+    @memoized_property
     def start_time(self):
         return self.log.get_SimTime("header")
 
-    @property
+    @memoized_property
     def sim_time(self):
         return self.log.get_SimTime()
 
-    @property
+    @memoized_property
     def wall_time(self):
         return self.log.get_ClockTime()
 
-    @property
+    @memoized_property
     def elapsed_sim_time(self):
         return self.sim_time - self.start_time
 
-    @property
+    @memoized_property
     def progress(self):
         if self.endTime == 0:
             return 0
         return self.sim_time / self.endTime
 
-    @property
-    def sim_speed(self):
+    @memoized_property
+    def avg_sim_speed(self):
+        """ sim speed averaged over the whole run """
         if self.wall_time == 0:
             return 0
         return self.elapsed_sim_time / self.wall_time
 
-    def time_till(self, end):
-        if self.sim_speed == 0:
+    @memoized_property
+    def speed_fit(self):
+        """ (sim speed, standard error) fitted over the last speed_window
+        samples of the log history or None if there are not enough """
+        fit = self.log.state.speed(self.speed_window)
+        if fit is None or fit[0] <= 0:
+            return None
+        return fit
+
+    @memoized_property
+    def sim_speed(self):
+        """ current sim speed, falls back to the average speed """
+        if self.speed_fit is None:
+            return self.avg_sim_speed
+        return self.speed_fit[0]
+
+    @memoized_property
+    def sim_speed_error(self):
+        if self.speed_fit is None:
+            return 0
+        return self.speed_fit[1]
+
+    def time_till(self, end, speed=None):
+        if speed is None:
+            speed = self.sim_speed
+        if speed <= 0:
             return datetime.timedelta.max
-        seconds = (end - self.sim_time) / self.sim_speed
+        seconds = (end - self.sim_time) / speed
         return datetime.timedelta(seconds=int(seconds))
 
-    @property
+    @memoized_property
+    def eta_range(self):
+        """ (earliest, latest) time till end within ETA_SIGMAS
+        standard errors of the current sim speed """
+        delta = ETA_SIGMAS * self.sim_speed_error
+        return (self.time_till(self.endTime, self.sim_speed + delta),
+                self.time_till(self.endTime, self.sim_speed - delta))
+
+    @memoized_property
     def time_till_end(self):
         return self.time_till(self.endTime)
 
-    @property
+    @memoized_property
     def time_till_writeout(self):
-        return self.time_till(self.last_timestep_ondisk + self.writeInterval)
+        # a time step being written by the processors is not written out yet
+        return self.time_till(self.last_complete_timestep_ondisk + self.writeInterval)
 
     def get_status(self):
         return Status(
                 self,
                 self.progress,
                 # Style.BRIGHT if self.log.active else Style.DIM,
-                50,
+                PROGRESS_DIGITS,
                 self.log.active,
                 self.folder,
                 os.path.basename(self.log.path),
@@ -321,8 +983,53 @@ class Case():
                 self.time_till_writeout,
                 self.time_till_end,
                 # Style.RESET_ALL
+                sampling=self.startSamplingPerc,
+                speed=(self.sim_speed, self.avg_sim_speed),
+                eta_range=self.eta_range,
+                courant=self.log.state.latest("Co"),
+                deltaT=self.log.state.latest("deltaT"),
+                residual=self.log.state.max_residual,
+                custom=self.log.state.custom,
+                written=self.last_complete_timestep_ondisk,
             )
 
+    def get_record(self):
+        """ returns the status as dict of plain values for machine readable
+        output, durations are given in seconds or None if unknown """
+        def seconds(delta):
+            if delta == datetime.timedelta.max:
+                return None
+            return int(delta.total_seconds())
+
+        record = {
+            "path": self.path,
+            "folder": self.folder,
+            "logfile": os.path.basename(self.log.path),
+            "exec": self.log.Exec,
+            "active": self.log.active,
+            "time": self.sim_time,
+            "end_time": self.endTime,
+            "progress": self.progress,
+            "sampling": self.startSamplingPerc,
+            "sim_speed": self.sim_speed,
+            "sim_speed_error": self.sim_speed_error,
+            "avg_sim_speed": self.avg_sim_speed,
+            "remaining": seconds(self.time_till_end),
+            "remaining_min": seconds(self.eta_range[0]),
+            "remaining_max": seconds(self.eta_range[1]),
+            "writeout": seconds(self.time_till_writeout),
+            "written": self.last_complete_timestep_ondisk,
+            "courant": self.log.state.latest("Co"),
+            "deltaT": self.log.state.latest("deltaT"),
+            "continuity": self.log.state.latest("continuity"),
+            "residuals": {field: series.latest for field, series
+                          in self.log.state.residuals.items()},
+        }
+        if self.filters:
+            record["custom_filter"] = {name: self.custom_filter_value(name)
+                                       for name in self.filters.names}
+        return record
+
     def print_status_full(self):
         self.log.print_log_body(self.log_filter)
         prog_prec = self.progress * 100
@@ -335,16 +1042,150 @@ class Case():
         print("Case end time: ", self.endTime)
         print("Current sim time: ", self.sim_time)
         print("Last time step on disk: ", self.last_timestep_ondisk)
+        print("Last time step complete: ", self.last_timestep_complete)
+        print("Last complete time step on disk: ", self.last_complete_timestep_ondisk)
         print("Time next writeout: ", self.time_till_writeout)
         print("Progress: ", prog_prec)
         print("time_till_end: ", self.time_till_end)
+        print("Sim speed: {:.3g} +- {:.2g} (average {:.3g})".format(
+            self.sim_speed, self.sim_speed_error, self.avg_sim_speed))
+
+
+class TimeDirs():
+    """ sorted index of the time step directories within a directory,
+    the directory is only listed again after its mtime changed """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.names = {}  # directory name -> time
+        self.times = []  # sorted times
+        # processor directories, only of interest in the case directory
+        self.processors = []
+
+    def refresh(self):
+        """ returns True if the directory changed """
+        STATS.count("stat calls")
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+
+        names = {}
+        processors = []
+        if mtime is not None:
+            STATS.count("dirs listed")
+            try:
+                entries = list(os.scandir(self.path))
+            except OSError:
+                entries = []
+            for entry in entries:
+                # e.g. a file named 0.orig is no time step
+                if not entry.is_dir():
+                    continue
+                if is_time_dir(entry.name):
+                    names[entry.name] = float(entry.name)
+                elif is_processor_dir(entry.name):
+                    processors.append(entry.name)
+
+        for name in self.names.keys() - names.keys():
+            t = self.names[name]
+            i = bisect.bisect_left(self.times, t)
+            if i < len(self.times) and self.times[i] == t:
+                del self.times[i]
+        for name in names.keys() - self.names.keys():
+            bisect.insort(self.times, names[name])
+        self.names = names
+        self.processors = sorted(processors)
+        return True
+
+    @property
+    def latest(self):
+        return self.times[-1] if self.times else 0
+
+    def __contains__(self, t):
+        i = bisect.bisect_left(self.times, t)
+        return i < len(self.times) and self.times[i] == t
+
+
+class WriteTimes():
+    """ index of the time steps written by a case
+
+    Handles serial cases, decomposed cases with processor<N> directories
+    and collated cases with processors<N> or processors<N>_<a>-<b>
+    directories.
+    """
+
+    def __init__(self, path):
+        self.case = TimeDirs(path)
+        self.processor_dirs = {}
+
+    @property
+    def processors(self):
+        return self.case.processors
+
+    def refresh(self):
+        """ the processor directories are written in parallel, thus only the
+        first one is listed on every refresh and the others only if its
+        latest time step changed or is not complete yet """
+        added = False
+        if self.case.refresh():
+            processor_dirs = {}
+            for name in self.case.processors:
+                d = self.processor_dirs.get(name)
+                if d is None:
+                    d = TimeDirs(os.path.join(self.case.path, name))
+                    added = True
+                processor_dirs[name] = d
+            self.processor_dirs = processor_dirs
+        if not self.processor_dirs:
+            return
+        dirs = list(self.processor_dirs.values())
+        latest = dirs[0].latest
+        dirs[0].refresh()
+        if added or dirs[0].latest != latest or not self.is_complete:
+            for d in dirs[1:]:
+                d.refresh()
+
+    @property
+    def latest(self):
+        """ latest time step found on disk, for decomposed cases the
+        latest time of any processor directory """
+        if self.processor_dirs:
+            return max(d.latest for d in self.processor_dirs.values())
+        return self.case.latest
+
+    @property
+    def latest_complete(self):
+        """ latest time step which exists in all processor directories """
+        if not self.processor_dirs:
+            return self.case.latest
+        dirs = list(self.processor_dirs.values())
+        for t in reversed(dirs[0].times):
+            if all(t in d for d in dirs[1:]):
+                return t
+        return 0
+
+    @property
+    def is_complete(self):
+        return self.latest == self.latest_complete
 
 
 class Status():
     """ Handle status of single case for simple printing  """
 
-    def __init__(self, case, progress, digits, active, folder, logfile, time, writeout, remaining):
+    __slots__ = ("case", "sampling", "progress", "digits", "active", "folder",
+                 "logfile", "time", "writeout", "remaining", "speed", "eta_range",
+                 "courant", "deltaT", "residual", "custom", "written")
+
+    def __init__(self, case, progress, digits, active, folder, logfile, time, writeout, remaining, sampling=0,
+                 speed=(0, 0), eta_range=None, courant=None, deltaT=None, residual=None,
+                 custom=None, written=0):
         self.case = case
+        self.sampling = sampling
         self.progress = progress
         self.digits = digits
         self.active = active
@@ -353,18 +1194,112 @@ class Status():
         self.time = str(time)
         self.writeout = str(writeout)
         self.remaining = str(remaining)
+        # current and average sim speed
+        self.speed = "{:.3g} ({:.3g})".format(*speed)
+        if eta_range is None or eta_range[0] == eta_range[1]:
+            self.eta_range = self.remaining
+        else:
+            self.eta_range = "{} - {}".format(*(
+                "?" if t == datetime.timedelta.max else t for t in eta_range))
+        self.courant = format_value(courant)
+        self.deltaT = format_value(deltaT)
+        self.residual = format_value(residual)
+        # name -> latest value of the custom filters, shared with the log
+        # parser which replaces instead of modifies it
+        self.custom = custom if custom is not None else {}
+        # latest time step written by all processors
+        self.written = str(written)
+
+    def __eq__(self, other):
+        if not isinstance(other, Status):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in self.__slots__)
+
+    def length(self, element):
+        """ width of the column element """
+        if element == "progressbar":
+            return self.digits
+        return len(getattr(self, element))
+
+    def custom_filter(self, name):
+        value = self.custom.get(name)
+        if value is None:
+            return "-"
+        if isinstance(value, (tuple, list)):
+            return " ".join(value)
+        return value
+
+
+
+class StatusColumns():
+    """ column store of the latest status of every case
+
+    The widths of every column and the active flags are kept in parallel
+    arrays, one row per case. The max widths are updated incrementally and
+    only recomputed, by max() over a single array, if the widest row of a
+    column became narrower or was removed.
+    """
+
+    # widths are stored as unsigned shorts
+    MAX_WIDTH = 65535
+
+    def __init__(self, elements=default_elements):
+        self.elements = elements
+        # row -> case path and case path -> row
+        self.paths = []
+        self.rows = {}
+        self.widths = {element: array("H") for element in elements}
+        self.active = array("b")
+        self.max_widths = {element: 0 for element in elements}
+        # columns whose max width has to be recomputed
+        self.stale = set()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def update(self, path, status):
+        row = self.rows.get(path)
+        if row is None:
+            row = self.rows[path] = len(self.paths)
+            self.paths.append(path)
+            self.active.append(0)
+            for column in self.widths.values():
+                column.append(0)
+        self.active[row] = bool(status.active)
+        for element in self.elements:
+            column = self.widths[element]
+            width = min(status.length(element), self.MAX_WIDTH)
+            if width >= self.max_widths[element]:
+                self.max_widths[element] = width
+                self.stale.discard(element)
+            elif column[row] == self.max_widths[element]:
+                self.stale.add(element)
+            column[row] = width
+
+    def remove(self, path):
+        """ the last row is moved into the row of path """
+        row = self.rows.pop(path)
+        last = len(self.paths) - 1
+        for element in self.elements:
+            column = self.widths[element]
+            if column[row] == self.max_widths[element]:
+                self.stale.add(element)
+            column[row] = column[last]
+            column.pop()
+        self.active[row] = self.active[last]
+        self.active.pop()
+        moved = self.paths.pop()
+        if moved != path:
+            self.paths[row] = moved
+            self.rows[moved] = row
 
-    @property
     def lengths(self):
-        """ returns the lengths of the returned strings """
-        return {"progressbar": self.digits,
-                "folder": len(self.folder),
-                "logfile": len(self.logfile),
-                "time": len(self.time),
-                "writeout": len(self.writeout),
-                "remaining": len(self.remaining),
-                }
-
-    def custom_filter(self, value):
-        return self.case.custom_filter_value(value)
+        """ returns the max width of every column """
+        for element in self.stale:
+            self.max_widths[element] = max(self.widths[element], default=0)
+        self.stale.clear()
+        return dict(self.max_widths)
 
+    def active_paths(self):
+        return list(itertools.compress(self.paths, self.active))
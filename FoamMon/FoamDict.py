@@ -0,0 +1,251 @@
+""" Minimal parser for OpenFOAM dictionaries like system/controlDict
+
+The parsed dictionaries are cached by (path, mtime, size) of the file and
+its included files, thus a file is only parsed again after it has changed.
+"""
+import os
+import re
+import threading
+
+from .stats import STATS
+
+TOKEN_RE = re.compile(r"""
+      (?P<ws>\s+)
+    | (?P<linecomment>//[^\n]*)
+    | (?P<blockcomment>/\*.*?\*/)
+    | (?P<linedirective>\#include(?:Func|Etc)\b(?:[^\n(]|\([^)]*\))*)
+    | (?P<string>"(?:[^"\\]|\\.)*")
+    | (?P<macro>\$\{[^}]*\})
+    | (?P<punct>[{}();\[\]])
+    | (?P<word>[^\s{}();\[\]"]+)
+""", re.VERBOSE | re.DOTALL)
+
+# path -> (stats of path and included files, parsed dictionary)
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def tokenize(text):
+    """ returns a list of tokens, comments, whitespace and the directives
+    which take the rest of their line are dropped """
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        m = TOKEN_RE.match(text, pos)
+        if m is None:
+            # unterminated comment or string, ignore the rest
+            break
+        pos = m.end()
+        kind = m.lastgroup
+        if kind in ("ws", "linecomment", "blockcomment", "linedirective"):
+            continue
+        tokens.append(m.group())
+    return tokens
+
+
+class FoamDictParser():
+    """ parses the tokens of an OpenFOAM dictionary into nested dicts
+
+    Entries with a single value are stored as string, entries with several
+    values or lists as list of strings, e.g. 'endTime 10;' becomes
+    {'endTime': '10'}. Sub dictionaries are stored as dicts.
+    """
+
+    def __init__(self, path, depth=0, included=None):
+        self.path = path
+        self.depth = depth
+        # paths of all included files
+        self.included = [] if included is None else included
+
+    def parse(self, text, scope=None, root=None):
+        self.tokens = tokenize(text)
+        self.pos = 0
+        target = {} if scope is None else scope
+        # the root dictionary is needed to resolve $:var macros
+        self.root = target if root is None else root
+        self.parse_dict(target, toplevel=True)
+        return target
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def parse_dict(self, target, toplevel=False):
+        while self.pos < len(self.tokens):
+            token = self.next()
+            if token == "}":
+                if not toplevel:
+                    return
+                continue
+            if token == ";":
+                continue
+            if token.startswith("#"):
+                self.parse_directive(token, target)
+                continue
+            if token.startswith("$") and self.peek() == ";":
+                # $subDict; merges the entries of subDict
+                value = self.lookup(token[1:], target)
+                if isinstance(value, dict):
+                    target.update(value)
+                continue
+
+            key = unquote(token)
+            if self.peek() == "{":
+                self.next()
+                sub = {}
+                self.parse_dict(sub)
+                target[key] = sub
+                continue
+            target[key] = self.parse_value(target)
+
+    def parse_value(self, scope):
+        """ parse the values until the terminating ';', lists are
+        returned as nested python lists """
+        values = []
+        stack = []
+        while self.pos < len(self.tokens):
+            token = self.next()
+            if token == ";" and not stack:
+                break
+            if token in ("(", "["):
+                stack.append(values)
+                values = []
+            elif token in (")", "]"):
+                if stack:
+                    sub = values
+                    values = stack.pop()
+                    values.append(sub)
+            elif token == "{":
+                # dictionaries within lists, e.g. fields ( U { mean on; } )
+                sub = {}
+                self.parse_dict(sub)
+                values.append(sub)
+            elif token == "}":
+                # missing ';' before the end of the enclosing dictionary
+                self.pos -= 1
+                break
+            elif token.startswith("$"):
+                value = self.lookup(token[1:], scope)
+                values.append(token if value is None else value)
+            else:
+                values.append(unquote(token))
+        while stack:
+            # unterminated list
+            sub = values
+            values = stack.pop()
+            values.append(sub)
+        if len(values) == 1:
+            return values[0]
+        return values
+
+    def parse_directive(self, token, target):
+        if token in ("#include", "#includeIfPresent", "#sinclude"):
+            if self.peek() is None:
+                return
+            fn = unquote(self.next())
+            fn = os.path.expandvars(os.path.expanduser(fn))
+            fn = fn.replace("$FOAM_CASE", case_dir(self.path))
+            if not os.path.isabs(fn):
+                fn = os.path.join(os.path.dirname(self.path), fn)
+            STATS.count("stat calls")
+            if self.depth > 10 or not os.path.isfile(fn):
+                return
+            try:
+                with open(fn) as f:
+                    text = f.read()
+            except OSError:
+                return
+            self.included.append(fn)
+            parser = FoamDictParser(fn, self.depth + 1, self.included)
+            parser.parse(text, scope=target, root=self.root)
+        elif token in ("#calc", "#codeStream"):
+            # can not be evaluated without an OpenFOAM installation,
+            # #includeEtc and #includeFunc are dropped by tokenize
+            if self.peek() is not None and self.peek() != ";":
+                self.next()
+        # #inputMode etc. are ignored
+
+    def lookup(self, name, scope):
+        """ resolves $name, $:a.b and $a/b style references """
+        name = name.strip("{}")
+        if name.startswith(":"):
+            scope = self.root
+            name = name[1:]
+        keys = [k for k in re.split(r"[./]", name) if k]
+        for value in (scope, self.root):
+            for key in keys:
+                if not isinstance(value, dict) or key not in value:
+                    value = None
+                    break
+                value = value[key]
+            if value is not None:
+                return value
+        return None
+
+
+def unquote(token):
+    if len(token) > 1 and token[0] == token[-1] == '"':
+        return token[1:-1]
+    return token
+
+
+def case_dir(path):
+    """ returns the case directory of a file in system or constant """
+    return os.path.dirname(os.path.dirname(os.path.abspath(path)))
+
+
+def file_key(path):
+    STATS.count("stat calls")
+    stat = os.stat(path)
+    return (path, stat.st_mtime, stat.st_size)
+
+
+def parse_file(path):
+    """ returns the parsed dictionary of path or None if it does not exist,
+    the result is cached until path or one of its includes changes """
+    try:
+        key = file_key(path)
+    except OSError:
+        return None
+    with _CACHE_LOCK:
+        cached = _CACHE.get(path)
+    if cached is not None and cached[0][0] == key:
+        try:
+            if all(file_key(k[0]) == k for k in cached[0][1:]):
+                return cached[1]
+        except OSError:
+            pass
+
+    try:
+        with open(path) as f:
+            text = f.read()
+    except OSError:
+        return None
+    parser = FoamDictParser(path)
+    parsed = parser.parse(text)
+
+    keys = [key]
+    for fn in parser.included:
+        try:
+            keys.append(file_key(fn))
+        except OSError:
+            pass
+    with _CACHE_LOCK:
+        _CACHE[path] = (keys, parsed)
+    return parsed
+
+
+def file_keys(path):
+    """ the (path, mtime, size) of path and its included files, which change
+    whenever parse_file(path) may change, None if path does not exist """
+    if parse_file(path) is None:
+        return None
+    with _CACHE_LOCK:
+        cached = _CACHE.get(path)
+    return None if cached is None else tuple(cached[0])
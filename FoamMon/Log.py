@@ -1,70 +1,459 @@
+import fnmatch
 import os
 import re
+import threading
 import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from .parser import LogParser
+from .stats import STATS
+from .segments import (DECODE_ERRORS, is_compressed, parse_chain, read_head,
+                       rotated_segments)
+from . import segments
 
 # max bytes of log that is read at once
 LEN_CACHE_BYTES = 100 * 1024
+# max number of lines of the log tail kept in memory
+MAX_CACHED_LINES = 4000
+# values of each series and samples of the history kept in the records of
+# the persistent cache, the history also keeps the speed window of the case
+RECORD_SAMPLES = 16
+# bytes of the header read at first, grows until the first ClockTime
+HEADER_CHUNK_BYTES = 4 * 1024
+# default max number of logs kept open at once
+MAX_OPEN_FILES = 128
+# default seconds since the last write until a log is inactive
+ACTIVE_TIMEOUT = 60
+# file names of logs, globs or regexes prefixed by 're:'
+LOG_PATTERNS = ["log", "log.*", "*.log"]
+# executables whose logs are not monitored
+UTILITY_EXECS = (
+    "blockMesh",
+    "checkMesh",
+    "createPatch",
+    "decomposePar",
+    "mapFields",
+    "reconstructPar",
+    "setFields",
+    "surfaceFeatureExtract",
+    "topoSet",
+)
+EXEC_RE = re.compile(r"Exec   : (.+)")
+
+
+def compile_log_patterns(patterns):
+    """ returns a regex which matches the whole file name of logs """
+    regexes = [p[3:] if p.startswith("re:") else fnmatch.translate(p)
+               for p in patterns]
+    return re.compile("|".join("(?:{})".format(r) for r in regexes))
+
+
+def is_utility(exec_):
+    """ True if exec_, the Exec header value, is in UTILITY_EXECS """
+    if not exec_:
+        return False
+    return os.path.basename(exec_.split()[0]) in UTILITY_EXECS
+
+
+def peek_exec(path):
+    """ returns the Exec of a log without opening it as Log,
+    or None if it has not been written yet """
+    try:
+        head = read_head(path, HEADER_CHUNK_BYTES).decode("utf-8", errors="replace")
+    except DECODE_ERRORS:
+        return None
+    m = EXEC_RE.search(head)
+    return m.group(1).strip() if m else None
+
+
+class FilePool():
+    """ LRU pool of open log files, at most max_open files are kept open,
+    files which are in use are not closed until they are released """
+
+    def __init__(self, max_open=MAX_OPEN_FILES):
+        self.max_open = max_open
+        self.lock = threading.Lock()
+        # path -> [file, number of users], least recently used first
+        self.files = OrderedDict()
+        # replaced files which are closed once they are released
+        self.stale = []
+
+    @contextmanager
+    def open(self, path):
+        """ yields the open file of path """
+        with self.lock:
+            entry = self.files.get(path)
+            if entry is not None:
+                self.files.move_to_end(path)
+                entry[1] += 1
+        if entry is None:
+            f = open(path, "rb")
+            with self.lock:
+                entry = self.files.get(path)
+                if entry is None:
+                    entry = self.files[path] = [f, 0]
+                else:
+                    # opened concurrently by another thread
+                    f.close()
+                    self.files.move_to_end(path)
+                entry[1] += 1
+                self.evict()
+        try:
+            yield entry[0]
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0 and entry in self.stale:
+                    self.stale.remove(entry)
+                    entry[0].close()
+                self.evict()
+
+    def evict(self):
+        """ close the least recently used files, requires the lock """
+        for path in list(self.files):
+            if len(self.files) <= self.max_open:
+                break
+            entry = self.files[path]
+            if entry[1] == 0:
+                del self.files[path]
+                entry[0].close()
+
+    def discard(self, path):
+        """ close the file of path, e.g. after it has been replaced """
+        with self.lock:
+            entry = self.files.pop(path, None)
+            if entry is None:
+                return
+            if entry[1] == 0:
+                entry[0].close()
+            else:
+                self.stale.append(entry)
+
+    def close(self):
+        with self.lock:
+            for entry in self.files.values():
+                entry[0].close()
+            self.files.clear()
+
+
+FILE_POOL = FilePool()
+
 
 class Log():
+    # seconds since the last write until the log is inactive, --active-timeout
+    active_timeout = ACTIVE_TIMEOUT
 
-    def __init__(self, path):
+    def __init__(self, path, record=None, filters=None):
         self.path = path
-        self.file = open(self.path, "rb")
-        self.mtime = os.path.getmtime(self.path)
-        self.cached_header = self.read_header()
-        self.cached_body = self.read_tail()
+        # CustomFilters evaluated on every appended line
+        self.filters = filters
+        # complete lines of the log tail, the last partial line is kept
+        # as bytes until it is completed
+        self.lines = deque(maxlen=MAX_CACHED_LINES)
+        # incremented on every change of the line cache, e.g. by priming
+        self.lines_version = 0
+        self.partial = b""
+        self.offset = 0
+        # False if the line cache has not been filled after a restore
+        self.primed = True
+        # the header is read on first access, see cached_header
+        self.header = None
+        self.header_complete = False
+        self._header_state = None
+        # the log is refreshed by the refresh pool and the focus screen
+        self.lock = threading.RLock()
+        if record is None or not self.restore(record):
+            self.open()
+
+    def open(self, resume=None):
+        """ (re)open the log and fill the caches from its tail, the
+        state and tail of rotated segments are continued, resume is the
+        rotation_point of the log before it has been rotated """
+        FILE_POOL.discard(self.path)
+        STATS.count("stat calls")
+        with FILE_POOL.open(self.path) as f:
+            stat = os.fstat(f.fileno())
+        self.inode = stat.st_ino
+        self.mtime = stat.st_mtime
+        self.header = None
+        self.header_complete = False
+        self._header_state = None
+        self.primed = True
+        self.find_segments()
+        chain = self.segments + ([self.path] if self.compressed else [])
+        tail = []
+        try:
+            self.state, tail = parse_chain(chain, self.filters, MAX_CACHED_LINES,
+                                           resume)
+        except DECODE_ERRORS:
+            self.state = LogParser(self.filters)
+        if self.compressed:
+            # archives do not grow, everything has been read
+            self.lines.clear()
+            self.lines.extend(tail)
+            self.lines_version += 1
+            self.offset = stat.st_size
+            self.partial = b""
+            return
+        self.read_tail(stat.st_size)
+        self.prepend(tail)
+
+    def rotation_point(self):
+        """ the inode, offset and state the log has been read up to, the
+        last line read identifies the offset in a copy of the log, see
+        segments.parse_chain """
+        if self.compressed or self.partial is None:
+            return None
+        last = self.lines[-1] + "\n" if self.lines else ""
+        return {
+            "inode": self.inode,
+            "offset": self.offset - len(self.partial),
+            "check": last.encode("utf-8"),
+            "state": self.state.get_record(),
+            "tail": tuple(self.lines),
+        }
+
+    def find_segments(self):
+        """ the rotated segments preceding this log, oldest first """
+        self.compressed = is_compressed(self.path)
+        self.segments = rotated_segments(self.path)
+
+    def prepend(self, lines):
+        """ add older lines to the line cache if it is not full yet """
+        free = self.lines.maxlen - len(self.lines)
+        if free > 0 and lines:
+            self.lines.extendleft(reversed(lines[-free:]))
+            self.lines_version += 1
+
+    @property
+    def cached_header(self):
+        """ the beginning of the log up to the line of the first ClockTime,
+        read on first access and again while it is incomplete """
+        with self.lock:
+            if not self.header_complete:
+                header, self.header_complete = self.read_header()
+                if header != self.header:
+                    self.header = header
+                    self._header_state = None
+            return self.header
+
+    @property
+    def header_state(self):
+        """ LogParser state of the header, e.g. the start time """
+        header = self.cached_header
+        with self.lock:
+            if self._header_state is None:
+                self._header_state = LogParser()
+                self._header_state.feed(header.split("\n")[1:])
+            return self._header_state
 
-    def __del__(self):
-        if self.file is not None:
-            self.file.close()
+    @property
+    def record_key(self):
+        """ changes whenever get_record changes, see cache.record_key """
+        offset = self.offset - len(self.partial or b"")
+        return (self.inode, self.mtime, offset, self.header_complete)
+
+    def get_record(self, history=RECORD_SAMPLES):
+        """ returns the state of the log as dict for the persistent cache,
+        with the last history samples of the history """
+        if self.partial is None:
+            offset, skip = self.offset, True
+        else:
+            offset, skip = self.offset - len(self.partial), False
+        return {
+            "inode": self.inode,
+            "mtime": self.mtime,
+            "offset": offset,
+            "skip": skip,
+            # an incomplete header is read again after a restore
+            "header": self.header if self.header_complete else None,
+            "state": self.state.get_record(RECORD_SAMPLES,
+                                           max(history, RECORD_SAMPLES)),
+        }
+
+    def restore(self, record):
+        """ resume from a record of get_record without reading the head and
+        tail of the log, returns False if the log has been replaced """
+        FILE_POOL.discard(self.path)
+        STATS.count("stat calls")
+        with FILE_POOL.open(self.path) as f:
+            stat = os.fstat(f.fileno())
+        if stat.st_ino != record["inode"] or stat.st_size < record["offset"]:
+            return False
+        self.inode = stat.st_ino
+        self.mtime = record["mtime"]
+        self.find_segments()
+        if record["header"] is not None:
+            self.header = record["header"]
+            self.header_complete = True
+        self.state = LogParser.from_record(record["state"], self.filters)
+        self.offset = record["offset"]
+        self.partial = None if record["skip"] else b""
+        self.primed = False
+        return True
+
+    def prime(self):
+        """ fill the line cache from the tail up to the current offset,
+        the parser state is not touched """
+        self.primed = True
+        if self.compressed:
+            data = self.read_segment_tail(self.path, LEN_CACHE_BYTES)
+            start = 0
+            skip = len(data) == LEN_CACHE_BYTES
+        else:
+            start = max(0, self.offset - LEN_CACHE_BYTES)
+            with FILE_POOL.open(self.path) as f:
+                f.seek(start, os.SEEK_SET)
+                data = f.read(self.offset - start)
+            skip = start > 0
+        if skip:
+            # drop the incomplete first line
+            data = data[data.find(b"\n")+1:]
+        end = data.rfind(b"\n")
+        lines = []
+        if end >= 0:
+            lines = data[:end].decode("utf-8", errors="replace").split("\n")
+        # lines appended after the restore are newer and kept
+        self.prepend(lines)
+        if start == 0 and self.segments and not self.compressed:
+            # the log is shorter than the tail, continue with the last segment
+            data = self.read_segment_tail(self.segments[-1], LEN_CACHE_BYTES)
+            data = data[data.find(b"\n")+1:]
+            self.prepend(data.decode("utf-8", errors="replace").splitlines())
+
+    def read_segment_tail(self, path, size):
+        try:
+            return segments.read_tail(path, size)
+        except DECODE_ERRORS:
+            return b""
 
     def read_header(self):
-        """ read LEN_CACHE_BYTES bytes from the beginning of the log """
-        # seek to the beginning of the file
-        self.file.seek(0, os.SEEK_SET)
-        # read the header
-        header = self.file.read(LEN_CACHE_BYTES).decode("utf-8")
-        # end the header somewhere after the first occurrence of ClockTime
-        ctime = header.find("ClockTime")
-        padding = min(ctime+100, len(header))
-        header = header[0:padding] # use 100 padding chars
-        return header
-
-    def read_tail(self):
-        """ read LEN_CACHE_BYTES bytes from the end of the log """
-        # seek before the end
+        """ read the beginning of the log until the end of the line of the
+        first ClockTime, the read size starts at HEADER_CHUNK_BYTES and
+        grows up to LEN_CACHE_BYTES, returns (header, complete) """
+        if self.compressed:
+            header = self.read_segment_header(self.path)
+            if self.segments and "Exec   :" not in header[0]:
+                return self.read_segment_header(self.segments[0])
+            return header
+        data = b""
+        size = HEADER_CHUNK_BYTES
+        with FILE_POOL.open(self.path) as f:
+            f.seek(0, os.SEEK_SET)
+            while True:
+                chunk = f.read(size - len(data))
+                data += chunk
+                ctime = data.find(b"ClockTime")
+                end = data.find(b"\n", ctime) if ctime >= 0 else -1
+                if end >= 0:
+                    data = data[:end]
+                    complete = True
+                    break
+                if len(data) >= LEN_CACHE_BYTES:
+                    # no time step within the first LEN_CACHE_BYTES
+                    complete = True
+                    break
+                if not chunk or len(data) < size:
+                    # end of the log, there is no complete time step yet
+                    complete = False
+                    break
+                size = min(4 * size, LEN_CACHE_BYTES)
+        STATS.count("bytes read", len(data))
+        if self.segments and b"Exec   :" not in data:
+            # rotated by copying and truncating, the banner is in the oldest segment
+            return self.read_segment_header(self.segments[0])
+        return data.decode("utf-8", errors="replace"), complete
+
+    def read_segment_header(self, path):
+        """ the header of a rotated segment, see read_header """
         try:
-            self.file.seek(-LEN_CACHE_BYTES, os.SEEK_END)
-        except OSError:
-            # the seek call above fails when the file is shorter than LEN_CACHE_BYTES
-            self.file.seek(0, os.SEEK_SET)
-        # read the bytes
-        tail = self.file.read(LEN_CACHE_BYTES)
-        # skip until the first '\n' byte before decoding
-        # (it might contain an incomplete multibyte character)
-        tail = tail[tail.find(b"\n"):]
-        # return the decoded text
-        return tail.decode("utf-8")
+            data = read_head(path, LEN_CACHE_BYTES)
+        except DECODE_ERRORS:
+            return "", True
+        ctime = data.find(b"ClockTime")
+        end = data.find(b"\n", ctime) if ctime >= 0 else -1
+        if end >= 0:
+            data = data[:end]
+        return data.decode("utf-8", errors="replace"), True
+
+    def read_tail(self, size):
+        """ fill the line cache from the last LEN_CACHE_BYTES bytes of the log """
+        self.lines.clear()
+        self.lines_version += 1
+        self.partial = b""
+        self.offset = max(0, size - LEN_CACHE_BYTES)
+        if self.offset > 0:
+            # skip until the first '\n' byte, the first line is likely
+            # incomplete and might contain an incomplete multibyte character
+            self.partial = None
+        self.read_appended()
+
+    def read_appended(self):
+        """ read the bytes appended since the last read and
+        returns the list of new complete lines """
+        with FILE_POOL.open(self.path) as f:
+            f.seek(self.offset, os.SEEK_SET)
+            data = f.read()
+        if not data:
+            return []
+        STATS.count("bytes read", len(data))
+        self.offset += len(data)
+        if self.partial is None:
+            # drop the incomplete first line after seeking into the file
+            start = data.find(b"\n")
+            if start < 0:
+                return []
+            data = data[start+1:]
+        else:
+            data = self.partial + data
+        end = data.rfind(b"\n")
+        self.partial = data[end+1:]
+        if end < 0:
+            return []
+        lines = data[:end].decode("utf-8", errors="replace").split("\n")
+        self.lines.extend(lines)
+        self.lines_version += 1
+        self.state.feed(lines)
+        return lines
 
     def refresh(self):
-        mtime = os.path.getmtime(self.path)
-        if self.mtime < mtime:
-            self.cached_body = self.read_tail()
-            self.mtime = mtime
+        """ read appended lines, reopens the log if it has been
+        truncated or replaced """
+        STATS.count("stat calls")
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        with self.lock:
+            if (stat.st_ino != self.inode or stat.st_size < self.offset
+                    or self.compressed and stat.st_size != self.offset):
+                self.open(self.rotation_point())
+            elif self.compressed:
+                pass
+            elif stat.st_size > self.offset:
+                if stat.st_size - self.offset > LEN_CACHE_BYTES:
+                    # too much has been appended, just continue from the tail
+                    self.read_tail(stat.st_size)
+                else:
+                    self.read_appended()
+            self.mtime = stat.st_mtime
+
+    def follow(self):
+        """ refresh and fill the line cache if it has not been yet """
+        self.refresh()
+        with self.lock:
+            if not self.primed:
+                self.prime()
 
     @property
     def is_valid(self):
         # TODO Fails on decompose logs
         if not self.path:
             return False
-        if self.Exec == "decomposePar" or self.Exec == "blockMesh" or self.Exec == "mapFields":
-            return False
-        try:
-            self.get_SimTime()
-            return True
-        except Exception as e:
-            # print("Invalid Log", e)
+        if is_utility(self.Exec):
             return False
+        return True
 
     @property
     def Exec(self):
@@ -86,45 +475,22 @@ class Log():
     def active(self):
         if not self.path:
             return False
-        mtime = os.path.getmtime(self.path)
-        return (time.time() - mtime) < 60
-
-    def get_values(self, regex, chunk):
-        return re.findall(regex, chunk)
-
-    def get_latest_value(self, regex, chunk):
-        return self.get_values(regex, chunk)[-1]
-
-    def get_latest_value_or_default(self, regex, chunk, default):
-        try:
-            return self.get_values(regex, chunk)[-1]
-        except IndexError:
-            return default
+        # mtime is kept up to date by refresh
+        return (time.time() - self.mtime) < self.active_timeout
 
-    def get_ClockTime(self, which="body"):
+    def get_state(self, which):
         if which == "body":
-            chunk = self.cached_body
+            return self.state
         elif which == "header":
-            chunk = self.cached_header
+            return self.header_state
         else:
             raise ValueError("the 'which' parameter must equal either \"header\" or \"body\"")
 
-        # NOTE some solver print only the ExecutionTime, thus both times are searched
-        # if Execution and Clocktime are presented both are found and ExecutionTime
-        # is discarded later
-        regex = "(?:Execution|Clock)Time = ([0-9.]*) s"
-        return float(self.get_latest_value_or_default(regex, chunk, 0.0))
+    def get_ClockTime(self, which="body"):
+        return self.get_state(which).clock_time
 
     def get_SimTime(self, which="body"):
-        if which == "body":
-            chunk = self.cached_body
-        elif which == "header":
-            chunk = self.cached_header
-        else:
-            raise ValueError("the 'which' parameter must equal either \"header\" or \"body\"")
-
-        regex = "\nTime = ([0-9.e\-]*)"
-        return float(self.get_latest_value_or_default(regex, chunk, 0.0))
+        return self.get_state(which).sim_time
 
     def get_header_value(self, key):
         ret = re.findall("{: <7}: (.+)".format(key), self.cached_header)
@@ -132,21 +498,29 @@ class Log():
             return ret[0]
         return None
 
-    def text(self, filter_):
-        lines = self.read_tail().split("\n")
-        if filter_:
-            return "\n".join([l for l in lines if filter_ in l])
-        return "\n".join(lines)
+    def tail(self, n, filter_=None):
+        """ returns the last n cached lines containing filter_, oldest first """
+        # copying the deque is atomic, iterating it is not
+        lines = list(self.lines)
+        if not filter_:
+            return lines[-n:] if n > 0 else []
+        matches = []
+        for line in reversed(lines):
+            if len(matches) >= n:
+                break
+            if filter_ in line:
+                matches.append(line)
+        matches.reverse()
+        return matches
 
     def print_log_body(self, log_filter=None):
         sep_width = 120
         print(self.path)
         print("="*sep_width)
         if log_filter is not None:
-            lines = self.cached_body.split("\n")
-            filt_lines = [l for l in lines if log_filter in l][-30:-1]
+            filt_lines = [l for l in self.lines if log_filter in l][-30:]
             body_str = ("\n".join(filt_lines))
         else:
-            body_str = ("\n".join(self.cached_body.split("\n")[-30:-1]))
+            body_str = ("\n".join(list(self.lines)[-30:]))
         print(body_str)
 
@@ -0,0 +1,181 @@
+""" Persistent state cache, so restarts do not rescan and re-read everything
+
+The discovered directories and cases, the state of their logs and the
+Exec of the candidate logs are stored in a SQLite database in
+~/.cache/foamMon. On startup the cases are restored from it and logs resume
+reading at their stored offsets.
+"""
+import json
+import os
+from functools import partial
+
+try:
+    import sqlite3
+except ImportError:
+    # python builds without sqlite support simply run without cache
+    sqlite3 = None
+
+# caches of other versions are dropped, bumped when the records change
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL, dirs TEXT);
+CREATE TABLE IF NOT EXISTS cases (path TEXT PRIMARY KEY, log TEXT);
+CREATE TABLE IF NOT EXISTS logs (path TEXT PRIMARY KEY, record TEXT);
+CREATE TABLE IF NOT EXISTS execs (path TEXT PRIMARY KEY, ino INTEGER, size INTEGER, exec TEXT);
+"""
+
+
+def default_cache_path():
+    cache_home = os.environ.get("XDG_CACHE_HOME",
+                                os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "foamMon", "state.sqlite")
+
+
+def to_root(path, roots):
+    """ returns the absolute path expressed relative to the root it is in,
+    as spelled on the command line, or None if it is outside all roots """
+    for r in roots:
+        abs_root = os.path.abspath(r)
+        if path == abs_root:
+            return r
+        if path.startswith(abs_root.rstrip(os.sep) + os.sep):
+            return os.path.join(r, os.path.relpath(path, abs_root))
+    return None
+
+
+def record_key(record):
+    """ the Log.record_key of a stored log record """
+    return (record["inode"], record["mtime"], record["offset"],
+            record["header"] is not None)
+
+
+class StateCache():
+
+    def __init__(self, path=None):
+        self.path = path or default_cache_path()
+        # table -> {absolute path: row or key of the log record} of the rows
+        # below the roots stored in the database, None until loaded
+        self.stored = None
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=5)
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            db.executescript("DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS cases;"
+                             "DROP TABLE IF EXISTS logs; DROP TABLE IF EXISTS execs;")
+            db.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+        db.executescript(SCHEMA)
+        return db
+
+    def load(self, roots):
+        """ returns the cached directories, cases, log records and Execs
+        below roots as (dir_cache, {case path: log path}, {log path: record},
+        {log path: (inode, size, Exec)}), paths are spelled relative to the
+        given roots """
+        dir_cache, cases, logs, execs = {}, {}, {}, {}
+        try:
+            db = self.connect()
+        except (OSError, sqlite3.Error):
+            return dir_cache, cases, logs, execs
+        stored = {"dirs": {}, "cases": {}, "logs": {}, "execs": {}}
+        try:
+            for path, mtime, dirs in db.execute("SELECT path, mtime, dirs FROM dirs"):
+                root_path = to_root(path, roots)
+                if root_path is not None:
+                    dir_cache[root_path] = (mtime, [tuple(d) for d in json.loads(dirs)])
+                    stored["dirs"][path] = (mtime, dirs)
+            for path, log in db.execute("SELECT path, log FROM cases"):
+                root_path, root_log = to_root(path, roots), to_root(log, roots)
+                if root_path is not None and root_log is not None:
+                    cases[root_path] = root_log
+                    stored["cases"][path] = log
+            for path, record in db.execute("SELECT path, record FROM logs"):
+                root_path = to_root(path, roots)
+                if root_path is not None:
+                    logs[root_path] = json.loads(record)
+                    stored["logs"][path] = record_key(logs[root_path])
+            for path, ino, size, exec_ in db.execute("SELECT path, ino, size, exec FROM execs"):
+                root_path = to_root(path, roots)
+                if root_path is not None:
+                    execs[root_path] = (ino, size, exec_)
+                    stored["execs"][path] = (ino, size, exec_)
+            self.stored = stored
+        except (sqlite3.Error, ValueError, KeyError):
+            pass
+        finally:
+            db.close()
+        return dir_cache, cases, logs, execs
+
+    def stored_paths(self, db, roots):
+        """ the paths of the rows below roots with unknown content, so they
+        are all replaced by the first save """
+        stored = {}
+        for table in ("dirs", "cases", "logs", "execs"):
+            stored[table] = {path: None for path, in db.execute(
+                                "SELECT path FROM {}".format(table))
+                             if to_root(path, roots) is not None}
+        return stored
+
+    def save(self, roots, dir_cache, cases):
+        """ replace the cached state below roots by the directory cache
+        and the given cases with their current log and log Execs, only the
+        rows which changed since the last load or save are written """
+        rows = {"dirs": {}, "cases": {}, "logs": {}, "execs": {}}
+        # log path -> function returning the record
+        records = {}
+        for path, (mtime, dirs) in dir_cache.items():
+            if mtime is not None:
+                rows["dirs"][os.path.abspath(path)] = (mtime, json.dumps(dirs))
+        for c in cases:
+            for fn, exec_ in c.log_execs.items():
+                rows["execs"][os.path.abspath(fn)] = tuple(exec_)
+            if c.log is not None:
+                log_path, key = os.path.abspath(c.log.path), c.log.record_key
+                records[log_path] = partial(c.log.get_record, c.speed_window)
+            elif c.log_records:
+                # restored case which has not been refreshed yet
+                log_path, record = next(iter(c.log_records.items()))
+                log_path, key = os.path.abspath(log_path), record_key(record)
+                records[log_path] = partial(dict, record)
+            else:
+                continue
+            rows["cases"][os.path.abspath(c.path)] = log_path
+            rows["logs"][log_path] = key
+
+        try:
+            db = self.connect()
+        except (OSError, sqlite3.Error):
+            return
+        try:
+            with db:
+                stored = self.stored
+                if stored is None:
+                    stored = self.stored_paths(db, roots)
+                for table, current in rows.items():
+                    db.executemany("DELETE FROM {} WHERE path = ?".format(table),
+                                   [(path,) for path in stored[table]
+                                    if path not in current])
+                changed = {table: [path for path, value in current.items()
+                                   if stored[table].get(path) != value]
+                           for table, current in rows.items()}
+                db.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                    [(path,) + rows["dirs"][path] for path in changed["dirs"]])
+                db.executemany("INSERT OR REPLACE INTO execs VALUES (?, ?, ?, ?)",
+                    [(path,) + rows["execs"][path] for path in changed["execs"]])
+                db.executemany("INSERT OR REPLACE INTO cases VALUES (?, ?)",
+                    [(path, rows["cases"][path]) for path in changed["cases"]])
+                db.executemany("INSERT OR REPLACE INTO logs VALUES (?, ?)",
+                    [(path, json.dumps(records[path]())) for path in changed["logs"]])
+            self.stored = rows
+        except sqlite3.Error:
+            pass
+        finally:
+            db.close()
+
+
+def get_cache(enabled=True, path=None):
+    if not enabled or sqlite3 is None:
+        return None
+    return StateCache(path)
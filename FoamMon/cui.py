@@ -1,13 +1,19 @@
+import asyncio
 import os
-import json
+from concurrent.futures import ThreadPoolExecutor
 
 import urwid
 import urwid.curses_display
+import urwid.raw_display
 
-import cProfile, pstats
-
+from .cache import get_cache
+from .Log import FILE_POOL, LOG_PATTERNS, Log
 from .header import foamMonHeader
-from .FoamDataStructures import Cases, default_elements
+from .parser import CustomFilters
+from .plot import sparkline, speeds
+from .FoamDataStructures import Cases, default_elements, format_value
+from .remote import RemoteCases
+from .stats import STATS
 
 # Set up color scheme
 palette = [
@@ -29,11 +35,18 @@ CASE_CTR = 0
 CASE_REFS = {}
 MODE_SWITCH = False
 FOCUS_ID = None
+# text filter of the focus screen log
 FILTER = None
 FPS = 1.0
+# bounds of the overview FPS, which follows the rate of new snapshots
+MIN_OVERVIEW_FPS = 0.2
+MAX_OVERVIEW_FPS = 5.0
 # TODO use COLUMNS for column width
 COLUMNS = {}
-FILTER = {}
+# compiled --custom_filter regexes, one column each
+CUSTOM_FILTERS = CustomFilters({})
+# show the timers and counters of foamMon below the screen
+SHOW_STATS = False
 
 
 class ProgressBar():
@@ -50,7 +63,7 @@ class ProgressBar():
 
 
     def add_event(self, percentage, color):
-        index = int(percentage*self.size)
+        index = min(int(percentage*self.size), self.size - 1)
         self.digits[index] = (color, " ")
 
     def draw(self):
@@ -59,46 +72,66 @@ class ProgressBar():
     def render(self):
         return urwid.Text(self.digits)
 
+def column_width(name, lengths):
+    """ width of the column name in the header and the rows, the
+    header name is not cut """
+    return max(lengths.get(name, 20), len(name))
+
+
 class TableHeader():
     # TODO create a base class
 
     def __init__(self, lengths):
         self.lengths = lengths
         global COLUMNS
-        global FILTER
-        self.columns = [CaseColumn(name, self.lengths.get(name, 20), None)
+        global CUSTOM_FILTERS
+        self.columns = [CaseColumn(name, column_width(name, self.lengths))
                 for name in default_elements
                 if COLUMNS[name]
                 ]
-        self.columns += [CaseColumn(el, 20, None) for el in FILTER.keys()]
+        self.columns += [CaseColumn(el, column_width(el, self.lengths), custom=True)
+                         for el in CUSTOM_FILTERS.names]
 
     @property
     def header_text(self):
-        s = "".join([c.getName() for c in self.columns])
+        # the rows start with the case Id
+        s = "   " + "".join([c.getName() for c in self.columns])
         return s
 
 
 class CaseColumn():
+    """ a single cell of a CaseRow, the text widget is kept
+    and only updated if its content changed """
 
-    def __init__(self, name, length, reference):
+    def __init__(self, name, length, custom=False):
         self.name = name
         self.length = length
-        self.reference = reference
+        # custom filter columns show the latest value of the filter name
+        self.custom = custom
+        self.markup = None
+        self.widget = urwid.Text("")
+
+    def update(self, reference, length, mode):
+        self.length = length
+        markup = self.get_markup(reference, mode)
+        if markup != self.markup:
+            self.markup = markup
+            self.widget.set_text(markup)
 
-    def get_pack(self, mode):
-        if isinstance(self.name, str):
+    def get_markup(self, reference, mode):
+        if not self.custom:
             if self.name == "progressbar":
-                return ("pack", urwid.Text(self.bar()))
-            return ("pack", urwid.Text((mode, "{: ^{length}}".format(
-                    getattr(self.reference, self.name), length=self.length+2))))
+                return self.bar(reference)
+            return (mode, "{: ^{length}}".format(
+                    getattr(reference, self.name), length=self.length+2))
         else:
-            return ("pack", urwid.Text((mode, "{: ^{length}}".format(
-                    self.reference.custom_filter(self.name[1]),
-                        length=self.length+2))))
+            return (mode, "{: ^{length}}".format(
+                    reference.custom_filter(self.name),
+                        length=self.length+2))
 
-    def bar(self):
-        bar = ProgressBar(50, self.reference.progress)
-        bar.add_event(self.reference.case.startSamplingPerc, "sampling")
+    def bar(self, reference):
+        bar = ProgressBar(reference.digits, reference.progress)
+        bar.add_event(reference.sampling, "sampling")
         return bar.digits
 
     def getName(self):
@@ -106,52 +139,88 @@ class CaseColumn():
 
 
 class CaseRow(urwid.WidgetWrap):
+    """ persistent row of a single case, see update """
 
-    def __init__(self, case, Id, length=False, active=False):
-
-        self.case = case
-        self.active = active
-        self.lengths = length
-        global CASE_CTR
-        global CASE_REFS
-        CASE_CTR +=  1
-        self.Id = CASE_CTR
-        CASE_REFS[int(self.Id)] = self.case.case
-
-        mode_text = "active" if self.active else "inactive"
+    def __init__(self):
+        self.status = None
+        self.Id = None
+        self.mode = None
+        self.id_text = urwid.Text("")
         global COLUMNS
-        global FILTER
-        if self.case:
-            self.columns = [CaseColumn(name, self.lengths.get(name, 20), self.case)
-                    for name in default_elements
-                    if COLUMNS[name]
-                    ]
-            self.columns += [CaseColumn(el, 20, self.case) for el in FILTER.items()]
+        global CUSTOM_FILTERS
+        self.columns = [CaseColumn(name, 20)
+                for name in default_elements
+                if COLUMNS[name]
+                ]
+        self.columns += [CaseColumn(el, 20, custom=True) for el in CUSTOM_FILTERS.names]
+        STATS.count("widgets built", len(self.columns) + 1)
 
                        #  ["Temperature",
                        # "T gas min/max  = ([0-9,. ]*)"]]]
 
-        else:
-            self.columns = []
-
         urwid.WidgetWrap.__init__(self, urwid.Columns(
-            [("pack", urwid.Text((mode_text, "{: ^2} ".format(self.Id))))]
-            + self.status_packs(mode_text)))
+            [("pack", self.id_text)]
+            + [("pack", c.widget) for c in self.columns]))
 
-    def status_packs(self, mode):
-        return [c.get_pack(mode) for c in self.columns]
+    def update(self, status, Id, lengths, active):
+        """ update only the widgets whose content changed """
+        mode = "active" if active else "inactive"
+        global CASE_REFS
+        CASE_REFS[int(Id)] = status.case
+        if Id != self.Id or mode != self.mode:
+            self.id_text.set_text((mode, "{: ^2} ".format(Id)))
+            self.Id = Id
+        if status is self.status and mode == self.mode:
+            if all(c.length == column_width(c.name, lengths) for c in self.columns):
+                return
+        self.status = status
+        self.mode = mode
+        for c in self.columns:
+            c.update(status, column_width(c.name, lengths), mode)
 
 
 class DisplaySub(urwid.WidgetWrap):
+    """ the cases of a single folder, rows are kept per case path """
 
-    def __init__(self, Id, name, elems, lengths, hide_inactive):
+    def __init__(self, Id, name):
         self.path = name
-        self.elems = elems
-        self.lengths = lengths
         self.Id = Id
-        self.hide_inactive = hide_inactive
-        self.frame = self.draw()
-        urwid.WidgetWrap.__init__(self, self.frame)
+        self.case_rows = {}
+        self.header = urwid.Text("")
+        self.footer = urwid.Divider("─")
+        self.pile = urwid.Pile([self.header, self.footer])
+        self.order = []
+        STATS.count("widgets built", 3)
+        urwid.WidgetWrap.__init__(self, self.pile)
+
+    def update(self, elems, lengths, hide_inactive, first_id):
+        """ update the rows from the elems of a snapshot,
+        returns the number of displayed rows """
+        self.elems = elems
+        self.header.set_text(("casefolder", self.props_str))
+
+        items = [(c, True) for c in elems["active"]]
+        if not hide_inactive:
+            items += [(c, False) for c in elems["inactive"]]
+
+        order = []
+        for i, (status, active) in enumerate(items):
+            path = status.case.path
+            row = self.case_rows.get(path)
+            if row is None:
+                row = self.case_rows[path] = CaseRow()
+            row.update(status, first_id + i, lengths, active)
+            order.append(path)
+
+        if order != self.order:
+            for path in set(self.case_rows) - set(order):
+                del self.case_rows[path]
+            self.order = order
+            self.pile.contents = (
+                    [(self.header, self.pile.options())]
+                    + [(self.case_rows[path], self.pile.options()) for path in order]
+                    + [(self.footer, self.pile.options())])
+        return len(items)
 
     @property
     def active(self):
@@ -161,20 +230,6 @@ class DisplaySub(urwid.WidgetWrap):
     def inactive(self):
         return self.elems["inactive"]
 
-    def draw(self):
-        items = [("pack", CaseRow(c, (i+1)*self.Id, self.lengths, active=True))
-                for i, c in enumerate(self.active)]
-
-        if not self.hide_inactive:
-            items += [("pack", CaseRow(c, (i+1+len(self.active))*self.Id, self.lengths, active=False))
-                    for i, c in enumerate(self.inactive)]
-
-        return urwid.BoxAdapter(urwid.Frame(
-            header=urwid.Text(("casefolder", self.props_str)),
-            body=urwid.Pile(items),
-            footer=urwid.Divider("─")),
-            height=len(items) + 2) # items + 1 and header and footer
-
     @property
     def props_str(self):
         num_active = len(self.elems["active"])
@@ -182,27 +237,74 @@ class DisplaySub(urwid.WidgetWrap):
         return "Folder: {} total: {}, active: {}".format(
                 self.path, num_inactive + num_active, num_active)
 
-    def update(self):
-        self._w = self.draw()
-        return self
-
 
 class CasesListFrame():
+    """ persistent ListBox with all sub folders, scroll position and
+    focus are kept between updates """
 
     def __init__(self, cases, hide_inactive):
         self.cases = cases
         self.hide_inactive = hide_inactive
+        self.version = None
+        self.lengths = None
+        self.header = urwid.Text("")
+        self.subs = {}
+        self.order = []
+        self.walker = urwid.SimpleFocusListWalker([self.header])
+        self.listbox = urwid.ListBox(self.walker)
 
     def draw(self):
-        """ return a ListBox with all sub folder """
-        lengths, valid_cases = self.cases.get_valid_cases()
-        items = [urwid.Text(TableHeader(lengths).header_text)]
-        items += [DisplaySub(i+1, path, elems, lengths, self.hide_inactive)
-            for i, (path, elems) in enumerate(valid_cases.items())]
-        return urwid.ListBox(urwid.SimpleFocusListWalker(items))
+        """ return the ListBox with all sub folder """
+        self.update()
+        return self.listbox
+
+    def update(self, force=False):
+        """ update the widgets from the latest snapshot, does nothing if
+        the snapshot did not change """
+        version, lengths, valid_cases = self.cases.latest_snapshot()
+        if version == self.version and not force:
+            return
+        self.version = version
+
+        if lengths != self.lengths:
+            self.lengths = lengths
+            self.header.set_text(TableHeader(lengths).header_text)
+
+        global CASE_CTR
+        CASE_CTR = 0
+        for i, (path, elems) in enumerate(valid_cases.items()):
+            sub = self.subs.get(path)
+            if sub is None:
+                sub = self.subs[path] = DisplaySub(i+1, path)
+            CASE_CTR += sub.update(elems, lengths, self.hide_inactive, CASE_CTR + 1)
+
+        order = list(valid_cases)
+        if order != self.order:
+            self.order = order
+            self.subs = {path: self.subs[path] for path in order}
+            self.walker[:] = [self.header] + list(self.subs.values())
 
     def toggle_hide(self):
         self.hide_inactive = not self.hide_inactive
+        self.update(force=True)
+
+
+class StatsPane(urwid.Text):
+    """ the timers and counters of STATS, see SHOW_STATS """
+
+    def update(self):
+        self.set_text(("inactive", "\n".join(STATS.format_lines())))
+
+
+STATS_PANE = StatsPane("")
+
+
+class TimedMainLoop(urwid.MainLoop):
+    """ adds the time spent rendering the screen to STATS """
+
+    def draw_screen(self):
+        with STATS.timer("render"):
+            super().draw_screen()
 
 
 class ScreenParent(urwid.WidgetWrap):
@@ -213,8 +315,19 @@ class ScreenParent(urwid.WidgetWrap):
         self.input_mode = False
         self.mode_switch = mode_switch
         self.input_txt = ""
+        # footer and STATS_PANE while SHOW_STATS is set
+        self.stats_footer = None
         urwid.WidgetWrap.__init__(self, self._w)
 
+    def with_stats(self, footer):
+        """ returns footer, below STATS_PANE if SHOW_STATS is set """
+        if not SHOW_STATS:
+            return footer
+        if self.stats_footer is None or self.stats_footer.contents[1][0] is not footer:
+            self.stats_footer = urwid.Pile([STATS_PANE, footer])
+        STATS_PANE.update()
+        return self.stats_footer
+
     def update(self):
         self._w = self.draw()
         return self
@@ -222,9 +335,13 @@ class ScreenParent(urwid.WidgetWrap):
     def keypress_parent(self, size, key):
         global FOCUS_ID
         global FILTER
+        global SHOW_STATS
         if key == 'Q' or key == 'q':
             self.cases.running = False
             raise urwid.ExitMainLoop()
+        elif (key == 'S' or key == 's') and not self.input_mode:
+            SHOW_STATS = not SHOW_STATS
+            self._w = self.draw()
         elif self.input_mode:
             if key != "enter" and key != "backspace":
                 self.input_txt += key
@@ -255,6 +372,8 @@ class OverviewScreen(ScreenParent):
         self.hide_inactive = hide_inactive
         self.cases_list_frame = CasesListFrame(self.cases, self.hide_inactive)
         self.input_mode_footer_txt = "Case ID: "
+        self.menu_footer = None
+        self.overview_frame = None
 
         # Draw empty screen first to construct base class
         self._w = urwid.Text("")
@@ -265,27 +384,37 @@ class OverviewScreen(ScreenParent):
     @property
     def footer(self):
         if not self.input_mode:
-            menu = urwid.Text([
-                    u'Press (', ('mode button', u'T'), u') to toggle active, ',
-                    u'(', ('mode button', u'F'), u') to focus, ',
-                    u'(', ('quit button', u'Q'), u') to quit,'],
-                        align="right")
-            legend = urwid.Text(["Legend: ",
-                ("progress", " "), " Progress ",
-                ("active", "Active"), " ",
-                ("inactive", "Inactive"), " ",
-                ("sampling", " "), " Sampling Start"])
-            return urwid.Columns([legend, menu])
+            if self.menu_footer is None:
+                menu = urwid.Text([
+                        u'Press (', ('mode button', u'T'), u') to toggle active, ',
+                        u'(', ('mode button', u'F'), u') to focus, ',
+                        u'(', ('mode button', u'S'), u') for stats, ',
+                        u'(', ('quit button', u'Q'), u') to quit,'],
+                            align="right")
+                legend = urwid.Text(["Legend: ",
+                    ("progress", " "), " Progress ",
+                    ("active", "Active"), " ",
+                    ("inactive", "Inactive"), " ",
+                    ("sampling", " "), " Sampling Start"])
+                self.menu_footer = urwid.Columns([legend, menu])
+            return self.with_stats(self.menu_footer)
         else:
             return urwid.Edit(self.input_mode_footer_txt)
 
     def draw(self):
+        """ the frame is built once, later calls only update it """
+        if self.overview_frame is None:
+            banner = urwid.Text(foamMonHeader, "center")
+            body = urwid.LineBox(self.cases_list_frame.draw())
+            self.overview_frame = urwid.Frame(header=banner, body=body,
+                                              footer=self.footer)
+        else:
+            self.cases_list_frame.update()
+            footer = self.footer
+            if footer is not self.overview_frame.footer:
+                self.overview_frame.footer = footer
 
-        banner = urwid.Text(foamMonHeader, "center")
-        body = urwid.LineBox(self.cases_list_frame.draw())
-        footer = self.footer
-
-        return urwid.Frame(header=banner, body=body, footer=footer)
+        return self.overview_frame
 
     def keypress(self, size, key):
         if key == 'F' or key == 'f':
@@ -298,45 +427,163 @@ class OverviewScreen(ScreenParent):
             self.keypress_parent(size, key)
 
 
+class SeriesPlot(urwid.Widget):
+    """ one sparkline per parsed series of a log, the series are
+    decimated to the width of the screen when they change """
+
+    _sizing = frozenset(["flow"])
+    # width of the name and latest value columns
+    name_width = 12
+    value_width = 10
+
+    def __init__(self, log):
+        self.log = log
+        self.key = None
+        self.canvas = None
+
+    def series(self):
+        """ returns (name, values, log scale) of all series to plot """
+        state = self.log.state
+        series = [(name, values.last(values.size), True)
+                  for name, values in sorted(state.residuals.items())]
+        series += [(name, state.series[name].last(state.series[name].size),
+                    name == "continuity")
+                   for name in ("Co", "deltaT", "continuity")
+                   if name in state.series]
+        if len(state.history) > 1:
+            series.append(("speed", speeds(state.history), False))
+        return series
+
+    def data_key(self):
+        state = self.log.state
+        return (state, state.steps, state.history.sim.count,
+                sum(s.count for s in state.residuals.values()),
+                sum(s.count for s in state.series.values()))
+
+    def update(self):
+        """ invalidate the canvas if the series changed """
+        if self.data_key() != self.key:
+            self._invalidate()
+
+    def rows(self, size, focus=False):
+        state = self.log.state
+        rows = len(state.residuals) + len(
+            [name for name in ("Co", "deltaT", "continuity") if name in state.series])
+        return rows + (len(state.history) > 1)
+
+    def render(self, size, focus=False):
+        (maxcol,) = size
+        key = self.data_key()
+        if key != self.key or self.canvas is None or self.canvas.cols() != maxcol:
+            self.key = key
+            width = maxcol - self.name_width - self.value_width - 1
+            lines = []
+            for name, values, log in self.series():
+                latest = format_value(values[-1]) if len(values) else "-"
+                lines.append("{: <{nw}}{} {: >{vw}}".format(
+                    name, sparkline(values, width, log), latest,
+                    nw=self.name_width, vw=self.value_width))
+            self.canvas = urwid.Text("\n".join(lines), wrap="clip").render((maxcol,))
+        return self.canvas
+
+
+class LogTail(urwid.Widget):
+    """ the last lines of a log which fit the screen """
+
+    _sizing = frozenset(["box"])
+
+    def __init__(self, log):
+        self.log = log
+        self.key = None
+
+    def data_key(self):
+        global FILTER
+        return (self.log.lines_version, FILTER)
+
+    def update(self):
+        if self.data_key() != self.key:
+            self.key = self.data_key()
+            self._invalidate()
+
+    def render(self, size, focus=False):
+        global FILTER
+        maxcol, maxrow = size
+        lines = self.log.tail(maxrow, FILTER)
+        text = urwid.Text("\n".join(lines), wrap="clip")
+        return urwid.Filler(text, valign="bottom").render(size)
+
+
 class FocusScreen(ScreenParent):
 
-    def __init__(self, focus_id):
+    def __init__(self, cases, focus_id):
+        self.cases = cases
         self.focus_id = focus_id
+        # future of the running log refresh
+        self.following = None
         self.hide_inactive = False
         self.input_mode_footer_txt = "Filter: "
+        self.menu_footer = None
+        self.focus_frame = None
         self._w = urwid.Text("")
         ScreenParent.__init__(self, self._w, False)
         self._w = self.draw()
 
     def draw(self):
-
+        """ the frame is built once, later calls only invalidate the widgets
+        whose content changed, the log is read in the refresh pool """
         global CASE_REFS
         global FOCUS_ID
-        banner = urwid.Text(foamMonHeader, "center")
-        # body = urwid.LineBox(self.cases_list_frame.draw())
-        global FILTER
-        body = urwid.Pile([
-            ("pack", urwid.Text(CASE_REFS[int(FOCUS_ID)].path)),
-            ("pack", urwid.Text(CASE_REFS[int(FOCUS_ID)].log.text(FILTER)))])
+        if self.focus_frame is None:
+            self.case = CASE_REFS[int(FOCUS_ID)]
+            banner = urwid.Text(foamMonHeader, "center")
+            if self.case.log is None:
+                # case of a remote agent, its log is not transferred
+                body = urwid.Filler(urwid.Text(
+                    "The log of {} is only available on its host".format(self.case.path)))
+            else:
+                self.follow()
+                self.plot = SeriesPlot(self.case.log)
+                self.log_tail = LogTail(self.case.log)
+                body = urwid.Pile([
+                    ("pack", urwid.Text(self.case.path)),
+                    ("pack", self.plot),
+                    ("pack", urwid.Divider("─")),
+                    self.log_tail])
+            self.focus_frame = urwid.Frame(header=banner, body=body,
+                                           footer=self.footer)
+        elif self.case.log is not None:
+            self.follow()
+            self.plot.update()
+            self.log_tail.update()
         footer = self.footer
+        if footer is not self.focus_frame.footer:
+            self.focus_frame.footer = footer
+        return self.focus_frame
 
-        return urwid.Frame(header=banner, body=body, footer=footer)
+    def follow(self):
+        """ refresh the log in the refresh pool, frames show the state of
+        the last completed refresh """
+        if self.following is None or self.following.done():
+            self.following = self.cases.refresh_pool.submit(self.case.log.follow)
 
 
     @property
     def footer(self):
         if not self.input_mode:
-            menu = urwid.Text([
-                    u'Press (', ('mode button', u'O'), u') for overview mode, ',
-                    u'(', ('mode button', u'/'), u') to filter, ',
-                    u'(', ('quit button', u'Q'), u') to quit,'],
-                        align="right")
-            legend = urwid.Text(["Legend: ",
-                ("progress", " "), " Progress ",
-                ("active", "Active"), " ",
-                ("inactive", "Inactive"), " ",
-                ("sampling", " "), " Sampling Start"])
-            return urwid.Columns([legend, menu])
+            if self.menu_footer is None:
+                menu = urwid.Text([
+                        u'Press (', ('mode button', u'O'), u') for overview mode, ',
+                        u'(', ('mode button', u'/'), u') to filter, ',
+                        u'(', ('mode button', u'S'), u') for stats, ',
+                        u'(', ('quit button', u'Q'), u') to quit,'],
+                            align="right")
+                legend = urwid.Text(["Legend: ",
+                    ("progress", " "), " Progress ",
+                    ("active", "Active"), " ",
+                    ("inactive", "Inactive"), " ",
+                    ("sampling", " "), " Sampling Start"])
+                self.menu_footer = urwid.Columns([legend, menu])
+            return self.with_stats(self.menu_footer)
         else:
             return urwid.Edit(self.input_mode_footer_txt)
 
@@ -359,6 +606,8 @@ class LogMonFrame(urwid.WidgetWrap):
         self.focus_mode = False
         self.focus_id = None
         self.mode_switch = False
+        # snapshot version of the last frame
+        self.version = None
         self.frame = OverviewScreen(self.cases, self.focus_id, self.mode_switch)
         self._w = self.frame
         urwid.WidgetWrap.__init__(self, self._w)
@@ -372,7 +621,7 @@ class LogMonFrame(urwid.WidgetWrap):
             return self.frame
         else:
             if isinstance(self.frame, OverviewScreen):
-                self.frame = FocusScreen(self.focus_id)
+                self.frame = FocusScreen(self.cases, self.focus_id)
                 MODE_SWITCH = False
                 FPS = 30.0
                 return self.frame
@@ -386,23 +635,65 @@ class LogMonFrame(urwid.WidgetWrap):
     def keypress(self, size, key):
         """ delegates keypress to the actual screen """
         self._w.keypress(size, key)
+        if MODE_SWITCH:
+            # do not wait for the next frame, it may be seconds away
+            self.redraw()
 
-    def animate(self, loop=None, data=None):
-        # Reset the case display number counter
-        global  CASE_CTR
-        CASE_CTR = 0
-
+    @STATS.timed("frame")
+    def redraw(self):
         self.frame = self.draw() # bodyTxt.update()
         self._w = self.frame
+
+    def adapt_fps(self):
+        """ the FPS of the overview is doubled after frames with a new
+        snapshot and halved after frames without """
+        global FPS
+        if not isinstance(self.frame, OverviewScreen):
+            return
+        version = self.cases.latest_snapshot().version
+        if version != self.version:
+            FPS = min(MAX_OVERVIEW_FPS, FPS * 2)
+        else:
+            FPS = max(MIN_OVERVIEW_FPS, FPS / 2)
+        self.version = version
+
+    def animate(self, loop=None, data=None):
+        self.redraw()
+        self.adapt_fps()
         global FPS
         self.animate_alarm = self.loop.set_alarm_in(1.0/FPS, self.animate)
 
-def cui_main(arguments):
+    async def animate_async(self, snapshot_ready):
+        """ asyncio replacement of animate, redraws as soon as a new snapshot
+        is ready or after 1/FPS seconds to follow mode switches and logs """
+        global FPS
+        while True:
+            try:
+                await asyncio.wait_for(snapshot_ready.wait(), 1.0/FPS)
+            except asyncio.TimeoutError:
+                pass
+            snapshot_ready.clear()
+            self.redraw()
+            self.adapt_fps()
+            self.loop.draw_screen()
 
-    # pr = cProfile.Profile()
-    # pr.enable()  # start profilin
 
-    cases = Cases(arguments.directories)
+def cui_main(arguments):
+    global CUSTOM_FILTERS
+    CUSTOM_FILTERS = CustomFilters.from_argument(arguments.custom_filter)
+
+    FILE_POOL.max_open = arguments.max_open_files
+    Log.active_timeout = arguments.active_timeout
+    if arguments.connect:
+        # aggregator of remote agents, no local discovery
+        cases = RemoteCases(arguments.connect)
+    else:
+        cases = Cases(arguments.directories, arguments.watcher,
+                      background=not arguments.asyncio,
+                      cache=get_cache(not arguments.no_cache),
+                      speed_window=arguments.speed_window,
+                      log_patterns=arguments.log_pattern or LOG_PATTERNS,
+                      filters=CUSTOM_FILTERS)
 
     global COLUMNS
     if arguments.progressbar:
@@ -429,15 +720,53 @@ def cui_main(arguments):
         COLUMNS["remaining"] = True
     else:
         COLUMNS["remaining"] = False
-
-    global FILTER
-    if arguments.custom_filter:
-        FILTER = json.loads(arguments.custom_filter)
+    if arguments.speed:
+        COLUMNS["speed"] = True
+    else:
+        COLUMNS["speed"] = False
+    if arguments.eta_range:
+        COLUMNS["eta_range"] = True
+    else:
+        COLUMNS["eta_range"] = False
+    if arguments.courant:
+        COLUMNS["courant"] = True
+    else:
+        COLUMNS["courant"] = False
+    if arguments.deltaT:
+        COLUMNS["deltaT"] = True
+    else:
+        COLUMNS["deltaT"] = False
+    if arguments.residual:
+        COLUMNS["residual"] = True
+    else:
+        COLUMNS["residual"] = False
 
     frame = LogMonFrame(cases)
-    mainloop = urwid.MainLoop(frame, palette, handle_mouse=False, screen=urwid.curses_display.Screen())
+    if arguments.asyncio:
+        aloop = asyncio.new_event_loop()
+        asyncio.set_event_loop(aloop)
+        event_loop = urwid.AsyncioEventLoop(loop=aloop)
+        # the curses screen does not support external event loops
+        screen = urwid.raw_display.Screen()
+    else:
+        event_loop = None
+        screen = urwid.curses_display.Screen()
+    mainloop = TimedMainLoop(frame, palette, handle_mouse=False,
+            screen=screen, event_loop=event_loop)
     frame.loop = mainloop
-    frame.animate()
+    if arguments.asyncio:
+        # file system access is offloaded to the executor, discovery,
+        # snapshots and rendering are cooperative tasks on the urwid loop
+        executor = ThreadPoolExecutor(2)
+        snapshot_ready = asyncio.Event()
+        tasks = [
+            aloop.create_task(cases.discover_async(executor)),
+            aloop.create_task(cases.produce_async(executor,
+                lambda snapshot: snapshot_ready.set())),
+            aloop.create_task(frame.animate_async(snapshot_ready)),
+        ]
+    else:
+        frame.animate()
     try:
         mainloop.run()
     except KeyboardInterrupt:
@@ -445,9 +774,11 @@ def cui_main(arguments):
     except:
         cases.running = False
         raise
-
-    # pr.disable()  # end profiling
-    # sortby = 'cumulative'
-    # ps = pstats.Stats(pr).sort_stats(sortby)
-    # ps.print_stats()
+    finally:
+        if arguments.asyncio:
+            for task in tasks:
+                task.cancel()
+            aloop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            executor.shutdown(wait=False)
+        cases.stop()
 
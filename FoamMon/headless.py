@@ -0,0 +1,63 @@
+""" Machine readable output of the case statuses without the curses UI
+
+The output is either a single JSON array of all cases or a stream of
+newline delimited JSON records, see Case.get_record for the fields.
+"""
+import json
+import sys
+import time
+
+from .FoamDataStructures import Cases
+from .cache import get_cache
+from .Log import FILE_POOL, LOG_PATTERNS, Log
+from .parser import CustomFilters
+
+
+def collect_records(cases):
+    """ refresh all cases and return their records """
+    cases.find_cases()
+    _, case_stats = cases.get_valid_cases(timeout=None)
+    records = []
+    for folder in case_stats.values():
+        for status in folder["active"] + folder["inactive"]:
+            try:
+                records.append(status.case.get_record())
+            except Exception:
+                # e.g. log vanished since the last refresh
+                continue
+    return records
+
+
+def make_cases(arguments):
+    """ returns the Cases of the arguments, refreshed by the caller """
+    FILE_POOL.max_open = arguments.max_open_files
+    Log.active_timeout = arguments.active_timeout
+    return Cases(arguments.directories, arguments.watcher, background=False,
+                 cache=get_cache(not arguments.no_cache),
+                 speed_window=arguments.speed_window,
+                 log_patterns=arguments.log_pattern or LOG_PATTERNS,
+                 filters=CustomFilters.from_argument(arguments.custom_filter))
+
+
+def json_main(arguments, out=sys.stdout):
+    cases = make_cases(arguments)
+    try:
+        if not arguments.ndjson:
+            json.dump(collect_records(cases), out)
+            out.write("\n")
+            return
+
+        # stream records, after the first pass only changed records
+        last = {}
+        while True:
+            for record in collect_records(cases):
+                line = json.dumps(record)
+                if last.get(record["path"]) != line:
+                    last[record["path"]] = line
+                    out.write(line + "\n")
+            out.flush()
+            time.sleep(arguments.interval)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        cases.stop()
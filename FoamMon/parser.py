@@ -0,0 +1,333 @@
+""" Streaming parser for OpenFOAM solver logs
+
+Each line is parsed once when it is appended to the log, the parser only
+keeps the latest values, so queries do not need to rescan the log.
+"""
+import json
+import math
+import re
+from array import array
+
+from .stats import STATS
+
+# NOTE some solver print only the ExecutionTime, thus both times are searched
+# if Execution and Clocktime are presented both are found and ExecutionTime
+# is discarded later
+TIME_RE = re.compile(r"Time = ([0-9.e\-]+)")
+CLOCK_TIME_RE = re.compile(r"(Execution|Clock)Time = ([0-9.]+) s")
+FLOAT = r"([-+0-9.eE]+|nan|inf)"
+RESIDUAL_RE = re.compile(r"Solving for ([^,\s]+), Initial residual = " + FLOAT
+                         + r", Final residual = " + FLOAT)
+COURANT_RE = re.compile(r"Courant Number mean: " + FLOAT + r" max: " + FLOAT)
+DELTAT_RE = re.compile(r"deltaT = " + FLOAT)
+CONTINUITY_RE = re.compile(r"continuity errors : sum local = " + FLOAT)
+
+# backreferences can not be combined into a single alternation
+BACKREF_RE = re.compile(r"\\[1-9]|\(\?P=")
+
+# number of (sim time, clock time) samples kept per log
+HISTORY_SIZE = 1024
+# number of values kept per residual and convergence series
+SERIES_SIZE = 256
+
+
+class Series():
+    """ fixed size ring buffer of floats """
+
+    def __init__(self, size=SERIES_SIZE):
+        self.size = size
+        self.values = array("d", bytes(8 * size))
+        # total number of appended values
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def append(self, value):
+        self.values[self.count % self.size] = value
+        self.count += 1
+
+    @property
+    def latest(self):
+        if self.count == 0:
+            return None
+        return self.values[(self.count - 1) % self.size]
+
+    def last(self, n):
+        """ returns an array of the last n values, oldest first """
+        n = min(n, len(self))
+        start = (self.count - n) % self.size
+        end = start + n
+        if end <= self.size:
+            return self.values[start:end]
+        return self.values[start:] + self.values[:end - self.size]
+
+    def get_record(self, n=None):
+        """ the last n values, all values by default """
+        return self.last(self.size if n is None else n).tolist()
+
+    @classmethod
+    def from_record(cls, values, size=SERIES_SIZE):
+        series = cls(size)
+        for value in values:
+            series.append(value)
+        return series
+
+
+class History():
+    """ fixed size ring buffer of (sim time, clock time) samples, one
+    sample per change of the clock time, i.e. per time step but at most one
+    per second since OpenFOAM prints the ClockTime in whole seconds """
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.sim = Series(size)
+        self.clock = Series(size)
+
+    def __len__(self):
+        return len(self.sim)
+
+    def append(self, sim, clock):
+        self.sim.append(sim)
+        self.clock.append(clock)
+
+    def last(self, n):
+        """ returns the sim and clock times of the last n samples, oldest first """
+        return self.sim.last(n), self.clock.last(n)
+
+    def get_record(self, n=None):
+        return {"sim": self.sim.get_record(n), "clock": self.clock.get_record(n)}
+
+    @classmethod
+    def from_record(cls, record, size=HISTORY_SIZE):
+        history = cls(size)
+        for sim, clock in zip(record["sim"], record["clock"]):
+            history.append(sim, clock)
+        return history
+
+
+class CustomFilters():
+    """ the compiled --custom_filter regexes, {name: regex}
+
+    Every line is first tested against a single alternation of all
+    regexes, only lines which match it are searched by each regex.
+    """
+
+    def __init__(self, filters):
+        self.names = list(filters)
+        self.regexes = [re.compile(filters[name]) for name in self.names]
+        self.prefilter = None
+        patterns = [r.pattern for r in self.regexes]
+        if not any(BACKREF_RE.search(p) for p in patterns):
+            try:
+                self.prefilter = re.compile(
+                        "|".join("(?:{})".format(p) for p in patterns))
+            except re.error:
+                pass
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_argument(cls, custom_filter):
+        """ returns the filters of the JSON --custom_filter argument """
+        if not custom_filter:
+            return cls({})
+        if isinstance(custom_filter, list):
+            custom_filter = custom_filter[0]
+        return cls(json.loads(custom_filter))
+
+    def scan(self, line, values):
+        """ store the latest match of every regex in line in values,
+        like re.findall it is the group if the regex has exactly one """
+        if self.prefilter is not None and not self.prefilter.search(line):
+            return
+        for name, regex in zip(self.names, self.regexes):
+            found = regex.findall(line)
+            if found:
+                values[name] = found[-1]
+
+
+def linear_fit(xs, ys):
+    """ least squares fit of ys = a + b*xs, returns the slope b and its
+    standard error, or None if the slope is undetermined """
+    n = len(xs)
+    if n < 2:
+        return None
+    mean_x = math.fsum(xs) / n
+    mean_y = math.fsum(ys) / n
+    sxx = math.fsum((x - mean_x) ** 2 for x in xs)
+    if sxx == 0:
+        return None
+    sxy = math.fsum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    slope = sxy / sxx
+    if n < 3:
+        return slope, 0.0
+    ssr = math.fsum((y - mean_y - slope * (x - mean_x)) ** 2
+                    for x, y in zip(xs, ys))
+    return slope, math.sqrt(ssr / (n - 2) / sxx)
+
+
+class LogParser():
+    """ compact state of a log, updated line by line """
+
+    def __init__(self, filters=None):
+        self.filters = filters
+        # name -> latest value of the custom filters, replaced on changes
+        # and never modified, thus statuses can share it
+        self.custom = {}
+        self.sim_time = 0.0
+        self.clock_time = 0.0
+        self.execution_time = 0.0
+        # number of time steps seen by the parser
+        self.steps = 0
+        self.history = History()
+        # field -> initial residuals, first solution of every time step
+        self.residuals = {}
+        # Co, Co_mean, deltaT and continuity -> values per time step
+        self.series = {}
+        # names of the values already stored for the current time step
+        self.solved = set()
+
+    def get_record(self, samples=None, history=None):
+        """ returns the state as dict of plain values, with only the last
+        samples values of each series and the last history samples of the
+        history if given """
+        record = {key: value for key, value in vars(self).items()
+                  if key not in ("filters", "history", "residuals", "series", "solved")}
+        record["history"] = self.history.get_record(history)
+        record["residuals"] = {name: series.get_record(samples)
+                               for name, series in self.residuals.items()}
+        record["series"] = {name: series.get_record(samples)
+                            for name, series in self.series.items()}
+        return record
+
+    @classmethod
+    def from_record(cls, record, filters=None):
+        parser = cls(filters)
+        for key, value in record.items():
+            if key == "custom":
+                # values of filters which are no longer used are dropped
+                parser.custom = {name: value[name] for name in (filters.names if filters else [])
+                                 if name in value}
+            elif key == "history":
+                parser.history = History.from_record(value)
+            elif key in ("residuals", "series"):
+                setattr(parser, key, {name: Series.from_record(values)
+                                      for name, values in value.items()})
+            elif hasattr(parser, key):
+                setattr(parser, key, value)
+        return parser
+
+    def latest(self, name):
+        """ returns the latest value of a series or None """
+        series = self.series.get(name)
+        return None if series is None else series.latest
+
+    @property
+    def max_residual(self):
+        """ the largest latest initial residual of all solved fields """
+        latest = [s.latest for s in self.residuals.values()]
+        return max(latest) if latest else None
+
+    def speed(self, window):
+        """ returns the sim speed and its standard error fitted over the last
+        window samples of the history, or None if there are not enough """
+        if len(self.history) < 3:
+            return None
+        sim, clock = self.history.last(window)
+        return linear_fit(clock, sim)
+
+    def feed(self, lines):
+        filters = self.filters if self.filters else None
+        if filters is not None:
+            custom = dict(self.custom)
+        # number of lines a regex has been applied to
+        scans = 0
+        for line in lines:
+            if filters is not None:
+                filters.scan(line, custom)
+            # cheap substring tests first, most lines match none of them
+            if "Time = " in line:
+                if line.startswith("Time = "):
+                    self.parse_time(line)
+                else:
+                    self.parse_clock_time(line)
+            elif "Solving for " in line:
+                self.parse_residual(line)
+            elif line.startswith("Courant Number"):
+                self.parse_courant(line)
+            elif line.startswith("deltaT = "):
+                self.parse_values(DELTAT_RE, line, ("deltaT",))
+            elif "continuity errors" in line:
+                self.parse_values(CONTINUITY_RE, line, ("continuity",))
+            else:
+                continue
+            scans += 1
+        if filters is not None and custom != self.custom:
+            self.custom = custom
+        STATS.count("lines parsed", len(lines))
+        STATS.count("regex scans", scans + (len(lines) if filters is not None else 0))
+
+    def add_value(self, target, name, value):
+        """ append value to the series name of target,
+        only the first value of every time step is kept """
+        if name in self.solved:
+            return
+        self.solved.add(name)
+        series = target.get(name)
+        if series is None:
+            series = target[name] = Series()
+        series.append(value)
+
+    def parse_time(self, line):
+        m = TIME_RE.match(line)
+        if not m:
+            return
+        try:
+            self.sim_time = float(m.group(1))
+        except ValueError:
+            return
+        self.steps += 1
+        self.solved.clear()
+
+    def parse_residual(self, line):
+        m = RESIDUAL_RE.search(line)
+        if not m:
+            return
+        try:
+            value = float(m.group(2))
+        except ValueError:
+            return
+        self.add_value(self.residuals, m.group(1), value)
+
+    def parse_courant(self, line):
+        # 'Interface Courant Number' etc. do not start with Courant
+        self.parse_values(COURANT_RE, line, ("Co_mean", "Co"))
+
+    def parse_values(self, regex, line, names):
+        m = regex.search(line)
+        if not m:
+            return
+        try:
+            values = [float(v) for v in m.groups()]
+        except ValueError:
+            return
+        for name, value in zip(names, values):
+            self.add_value(self.series, name, value)
+
+    def parse_clock_time(self, line):
+        matches = CLOCK_TIME_RE.findall(line)
+        if not matches:
+            return
+        clock_time = self.clock_time
+        for kind, value in matches:
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+            if kind == "Execution":
+                self.execution_time = value
+            # the last match of either kind is reported as clock time
+            self.clock_time = value
+        if self.clock_time != clock_time:
+            self.history.append(self.sim_time, self.clock_time)
@@ -0,0 +1,62 @@
+""" Text sparklines of the parsed time series
+
+The series are decimated to the available width first, thus the cost of a
+plot depends on the terminal width and not on the number of time steps.
+"""
+import math
+
+BLOCKS = "▁▂▃▄▅▆▇█"
+
+
+def decimate(values, width):
+    """ returns the min and max of width buckets of values,
+    or values itself if there are fewer than width values """
+    n = len(values)
+    if n <= width:
+        return list(values), list(values)
+    mins = []
+    maxs = []
+    for i in range(width):
+        bucket = values[i * n // width:(i + 1) * n // width]
+        mins.append(min(bucket))
+        maxs.append(max(bucket))
+    return mins, maxs
+
+
+def log10(value):
+    if value > 0:
+        return math.log10(value)
+    return -math.inf
+
+
+def sparkline(values, width, log=False):
+    """ returns a sparkline of at most width characters, every character
+    shows the maximum of its bucket, log plots the log10 of values """
+    if width <= 0 or not len(values):
+        return ""
+    mins, maxs = decimate(values, width)
+    if log:
+        # log10 is monotonic, thus it is applied after decimation
+        mins = [log10(v) for v in mins]
+        maxs = [log10(v) for v in maxs]
+    finite = [v for v in mins + maxs if math.isfinite(v)]
+    if not finite:
+        return BLOCKS[0] * len(maxs)
+    low = min(finite)
+    high = max(finite)
+    scale = (len(BLOCKS) - 1) / (high - low) if high > low else 0
+    chars = []
+    for v in maxs:
+        if not math.isfinite(v):
+            chars.append(BLOCKS[0] if v < 0 else BLOCKS[-1])
+        else:
+            chars.append(BLOCKS[int(round((v - low) * scale))])
+    return "".join(chars)
+
+
+def speeds(history):
+    """ returns the sim speed between consecutive samples of a History """
+    sim, clock = history.last(history.sim.size)
+    return [(s1 - s0) / (c1 - c0)
+            for s0, s1, c0, c1 in zip(sim, sim[1:], clock, clock[1:])
+            if c1 > c0]
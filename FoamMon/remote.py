@@ -0,0 +1,343 @@
+""" Monitoring of cases on other hosts
+
+An agent runs Cases on a host and serves the records of its cases, see
+Case.get_record, as newline delimited JSON over a Unix or TCP socket. The
+first message of a connection contains all records, later messages only
+the fields which changed and the removed cases:
+
+    {"host": "node01", "full": false, "set": {path: {field: value}}, "del": [path]}
+
+RemoteCases connects to several agents and merges their records into
+snapshots for the overview, it has the interface of Cases used by the UI.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+
+from .headless import make_cases
+from .FoamDataStructures import (Cases, PROGRESS_DIGITS, SNAPSHOT_INTERVAL,
+                                 Snapshot, Status, default_elements)
+
+log = logging.getLogger(__name__)
+
+# seconds between two messages of an agent
+AGENT_INTERVAL = 2.0
+# seconds between two connection attempts to an agent
+RECONNECT_INTERVAL = 5.0
+
+
+def parse_address(address):
+    """ returns (family, address) of 'unix:/path', '/path' or 'host:port' """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    if "/" in address:
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "localhost", int(port))
+
+
+def record_delta(old, new):
+    """ returns the fields of new which differ from old """
+    if old is None:
+        return new
+    return {key: value for key, value in new.items() if old.get(key) != value}
+
+
+class Agent():
+    """ serves the records of cases to any number of clients """
+
+    def __init__(self, cases, address, interval=AGENT_INTERVAL):
+        self.cases = cases
+        self.family, self.address = parse_address(address)
+        self.interval = interval
+        self.host = socket.gethostname()
+        self.running = True
+        self.sock = None
+        # inode of the Unix socket bound by this agent
+        self.bound = None
+        # time of the last find_cases
+        self.scanned = 0
+        # path -> record, replaced by the producer every interval
+        self.records = {}
+        self.version = 0
+        self.updated = threading.Condition()
+
+    def produce(self):
+        """ refresh the cases and publish their records every interval """
+        while self.running:
+            try:
+                records = self.collect()
+            except Exception:
+                # keep serving the last records, e.g. on a hung filesystem
+                log.exception("refreshing the cases failed")
+            else:
+                with self.updated:
+                    self.records = records
+                    self.version += 1
+                    self.updated.notify_all()
+            time.sleep(self.interval)
+
+    def collect(self):
+        """ refresh the cases and return their records by path """
+        # rescans are requested by watcher events or periodic, mostly
+        # only for directories which can not be watched
+        if (self.cases.rescan
+                or time.time() - self.scanned >= self.cases.rescan_interval):
+            self.scanned = time.time()
+            self.cases.rescan = False
+            self.cases.find_cases()
+        _, case_stats = self.cases.get_valid_cases(timeout=None)
+        records = {}
+        for folder in case_stats.values():
+            for status in folder["active"] + folder["inactive"]:
+                try:
+                    record = status.case.get_record()
+                except Exception:
+                    # e.g. log vanished since the last refresh
+                    continue
+                records[record["path"]] = record
+        return records
+
+    def handle(self, conn):
+        """ send the records and then their deltas to a client """
+        sent = {}
+        version = None
+        full = True
+        with conn:
+            while self.running:
+                with self.updated:
+                    self.updated.wait_for(
+                        lambda: self.version != version or not self.running)
+                    version = self.version
+                    records = self.records
+                changed = {}
+                for path, record in records.items():
+                    delta = record_delta(sent.get(path), record)
+                    if delta:
+                        changed[path] = delta
+                removed = [path for path in sent if path not in records]
+                if not (full or changed or removed):
+                    continue
+                message = {"host": self.host, "full": full, "set": changed, "del": removed}
+                try:
+                    conn.sendall((json.dumps(message) + "\n").encode())
+                except OSError:
+                    return
+                full = False
+                sent = records
+
+    def listen(self):
+        """ bind the socket, a stale Unix socket of an earlier agent is
+        replaced but no other file """
+        if self.family == socket.AF_UNIX:
+            try:
+                mode = os.lstat(self.address).st_mode
+            except FileNotFoundError:
+                pass
+            else:
+                if not stat.S_ISSOCK(mode):
+                    raise FileExistsError("{} exists and is not a socket".format(self.address))
+                os.unlink(self.address)
+        self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.address)
+        if self.family == socket.AF_UNIX:
+            self.bound = os.lstat(self.address).st_ino
+        self.sock.listen()
+
+    def serve(self):
+        """ accept clients until stop is called """
+        if self.sock is None:
+            self.listen()
+        threading.Thread(target=self.produce, daemon=True).start()
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        with self.updated:
+            self.updated.notify_all()
+        if self.sock is not None:
+            self.sock.close()
+        if self.bound is not None:
+            # only the socket bound by this agent, not one of a newer agent
+            try:
+                if os.lstat(self.address).st_ino == self.bound:
+                    os.unlink(self.address)
+            except OSError:
+                pass
+            self.bound = None
+
+
+class RemoteCase():
+    """ stands in for a Case of another host in a Status """
+
+    def __init__(self, host, path):
+        self.host = host
+        self.path = "{}:{}".format(host, path)
+        self.folder = os.path.basename(path)
+        # logs of other hosts can not be focused
+        self.log = None
+
+
+def seconds_to_timedelta(seconds):
+    if seconds is None:
+        return datetime.timedelta.max
+    return datetime.timedelta(seconds=seconds)
+
+
+def status_from_record(case, record, digits=PROGRESS_DIGITS):
+    """ the Status of a record, digits is the width of the progress bar """
+    residuals = [v for v in record.get("residuals", {}).values() if v is not None]
+    return Status(
+            case,
+            record["progress"],
+            digits,
+            record["active"],
+            record["folder"],
+            record["logfile"],
+            record["time"],
+            seconds_to_timedelta(record["writeout"]),
+            seconds_to_timedelta(record["remaining"]),
+            sampling=record.get("sampling", 0),
+            speed=(record["sim_speed"], record["avg_sim_speed"]),
+            eta_range=(seconds_to_timedelta(record["remaining_min"]),
+                       seconds_to_timedelta(record["remaining_max"])),
+            courant=record.get("courant"),
+            deltaT=record.get("deltaT"),
+            residual=max(residuals) if residuals else None,
+            custom=record.get("custom_filter"),
+            written=record.get("written", 0),
+        )
+
+
+class RemoteCases():
+    """ merges the records of several agents into snapshots """
+
+    def __init__(self, addresses, digits=PROGRESS_DIGITS):
+        self.addresses = addresses
+        # width of the progress bars
+        self.digits = digits
+        self.running = True
+        self.lock = threading.Lock()
+        # address -> host name, several agents may run on one host
+        self.hosts = {}
+        # (address, path) -> record
+        self.records = {}
+        # (address, path) -> RemoteCase, kept so statuses compare equal
+        self.cases = {}
+        self.snapshot = Snapshot(0, {element: 0 for element in default_elements}, {})
+        for address in addresses:
+            threading.Thread(target=self.receive, args=(address,), daemon=True).start()
+        threading.Thread(target=self.producer, daemon=True).start()
+
+    def receive(self, address):
+        """ read the messages of an agent, reconnects if it goes away """
+        family, addr = parse_address(address)
+        while self.running:
+            try:
+                with socket.socket(family, socket.SOCK_STREAM) as sock:
+                    sock.connect(addr)
+                    for line in sock.makefile("r"):
+                        if not self.running:
+                            return
+                        self.apply(address, json.loads(line))
+            except (OSError, ValueError):
+                pass
+            self.disconnected(address)
+            time.sleep(RECONNECT_INTERVAL)
+
+    def apply(self, address, message):
+        with self.lock:
+            self.hosts[address] = message["host"]
+            if message["full"]:
+                for key in [k for k in self.records if k[0] == address]:
+                    del self.records[key]
+            for path, fields in message["set"].items():
+                self.records.setdefault((address, path), {}).update(fields)
+            for path in message["del"]:
+                self.records.pop((address, path), None)
+
+    def disconnected(self, address):
+        """ cases of an unreachable agent are shown as inactive """
+        with self.lock:
+            for key, record in self.records.items():
+                if key[0] == address:
+                    record["active"] = False
+
+    def produce_snapshot(self):
+        with self.lock:
+            records = {key: dict(record) for key, record in self.records.items()}
+            hosts = dict(self.hosts)
+        case_stats = {}
+        for (address, path), record in sorted(records.items()):
+            host = hosts[address]
+            case = self.cases.get((address, path))
+            if case is None:
+                case = self.cases[(address, path)] = RemoteCase(host, path)
+            try:
+                status = status_from_record(case, record, self.digits)
+            except KeyError:
+                continue
+            folder = case_stats.setdefault(
+                    "{}:{}".format(host, os.path.dirname(path)),
+                    {"active": [], "inactive": []})
+            folder["active" if status.active else "inactive"].append(status)
+        case_stats = {folder: {"active": tuple(stats["active"]),
+                               "inactive": tuple(stats["inactive"])}
+                      for folder, stats in case_stats.items()}
+        lengths = Cases.get_max_lengths(case_stats)
+        if case_stats == self.snapshot.case_stats and lengths == self.snapshot.lengths:
+            return self.snapshot
+        self.snapshot = Snapshot(self.snapshot.version + 1, lengths, case_stats)
+        return self.snapshot
+
+    def producer(self):
+        while self.running:
+            self.produce_snapshot()
+            time.sleep(SNAPSHOT_INTERVAL)
+
+    def latest_snapshot(self):
+        return self.snapshot
+
+    async def discover_async(self, executor):
+        """ agents discover their cases themselves """
+
+    async def produce_async(self, executor, on_snapshot=None):
+        version = None
+        while self.running:
+            snapshot = self.latest_snapshot()
+            if snapshot.version != version and on_snapshot is not None:
+                version = snapshot.version
+                on_snapshot(snapshot)
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+
+    def stop(self):
+        self.running = False
+
+
+def agent_main(arguments):
+    cases = make_cases(arguments)
+    agent = Agent(cases, arguments.agent, arguments.interval)
+    try:
+        agent.listen()
+        agent.serve()
+    except FileExistsError as e:
+        sys.exit("foamMon: --agent {}".format(e))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.stop()
+        cases.stop()
@@ -0,0 +1,318 @@
+""" Rotated and compressed log segments
+
+Long runs rotate their logs, e.g. log.pimpleFoam.2.gz, log.pimpleFoam.1.gz
+and log.pimpleFoam. The archived segments do not change anymore, thus each
+is decoded once: the parser state and tail after a chain of segments are
+cached, and a gzip segment keeps a checkpoint index so its tail can be
+read again without decompressing it from the start. When the live log is
+rotated, its state is continued at the offset it had been read up to.
+"""
+import bz2
+import itertools
+import lzma
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict, deque
+
+from .parser import LogParser
+from .stats import STATS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# errors of unreadable or corrupt segments
+DECODE_ERRORS = (OSError, EOFError, zlib.error, lzma.LZMAError)
+if zstandard is not None:
+    DECODE_ERRORS += (zstandard.ZstdError,)
+
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz", ".zst")
+# name.N or name.N.gz etc., N = 1 is the most recent rotated segment
+ROTATED_RE = re.compile(r"^(?P<base>.+)\.(?P<number>[0-9]+)(?P<suffix>\.gz|\.bz2|\.xz|\.zst)?$")
+
+# bytes read from a compressed segment at once
+READ_CHUNK_BYTES = 256 * 1024
+# compressed bytes read at once for the head of a segment
+HEAD_CHUNK_BYTES = 4 * 1024
+# decompressed bytes between two checkpoints of a gzip index
+INDEX_SPAN_BYTES = 4 * 1024 * 1024
+# max number of cached segment chains and gzip indices
+MAX_CACHED_CHAINS = 64
+
+# keys of a chain of segments -> (parser record, tail lines)
+_CHAINS = OrderedDict()
+# segment key -> GzipIndex
+_INDICES = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def is_compressed(path):
+    return path.endswith(COMPRESSED_SUFFIXES)
+
+
+def segment_key(path):
+    """ identifies the content of a segment, renames keep the key """
+    STATS.count("stat calls")
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+
+def decompressor(path):
+    """ returns a streaming decompressor object for the suffix of path,
+    or None if the segment is not compressed """
+    if path.endswith(".gz"):
+        return zlib.decompressobj(wbits=31)
+    if path.endswith(".bz2"):
+        return bz2.BZ2Decompressor()
+    if path.endswith(".xz"):
+        return lzma.LZMADecompressor()
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise OSError("reading {} requires the zstandard module".format(path))
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+def iter_chunks(path, index=None, chunk_bytes=READ_CHUNK_BYTES, start=0):
+    """ yields the decompressed content of path from the offset start on in
+    chunks of chunk_bytes read bytes. Checkpoints of gzip segments are added
+    to index and the nearest checkpoint before start is resumed from """
+    decomp = decompressor(path)
+    with open(path, "rb") as f:
+        if decomp is None:
+            f.seek(start, os.SEEK_SET)
+            while True:
+                chunk = f.read(chunk_bytes)
+                if not chunk:
+                    return
+                yield chunk
+        in_offset = 0
+        out_offset = 0
+        checkpoint = index.find(start) if index is not None else None
+        if checkpoint is not None:
+            out_offset, in_offset, decomp = checkpoint
+            decomp = decomp.copy()
+            f.seek(in_offset, os.SEEK_SET)
+        while True:
+            if index is not None and out_offset >= index.next_checkpoint:
+                index.add(out_offset, in_offset, decomp)
+            data = f.read(chunk_bytes)
+            if not data:
+                if index is not None:
+                    index.size = out_offset
+                return
+            in_offset += len(data)
+            chunk = decomp.decompress(data)
+            # concatenated gzip members, e.g. of pigz or appended logs
+            while path.endswith(".gz") and decomp.eof and decomp.unused_data:
+                rest = decomp.unused_data
+                decomp = zlib.decompressobj(wbits=31)
+                chunk += decomp.decompress(rest)
+            out_offset += len(chunk)
+            if chunk and out_offset > start:
+                # only the part from start on, chunks before are skipped
+                yield chunk[max(0, len(chunk) - (out_offset - start)):]
+
+
+class GzipIndex():
+    """ checkpoints (decompressed offset, compressed offset, decompressor)
+    of a gzip segment for random access to its decompressed content """
+
+    def __init__(self, path):
+        self.path = path
+        self.checkpoints = []
+        # decompressed size, None until the segment has been read to its end
+        self.size = None
+        self.next_checkpoint = 0
+
+    def add(self, out_offset, in_offset, decomp):
+        self.checkpoints.append((out_offset, in_offset, decomp.copy()))
+        self.next_checkpoint = out_offset + INDEX_SPAN_BYTES
+
+    def find(self, start):
+        """ the last checkpoint at or before start, None if there is none """
+        checkpoint = None
+        for c in self.checkpoints:
+            if c[0] > start:
+                break
+            checkpoint = c
+        return checkpoint
+
+    def read(self, start):
+        """ returns the decompressed content from start to the end,
+        decompressing from the nearest checkpoint before start """
+        return b"".join(iter_chunks(self.path, self, start=start))
+
+
+def rotated_segments(path):
+    """ returns the paths of the segments rotated before the log path,
+    oldest first. If path is a rotated segment itself, e.g. log.foo.1.gz,
+    these are the segments with a larger number """
+    directory, name = os.path.split(path)
+    m = ROTATED_RE.match(name)
+    if m:
+        base, newest = m.group("base"), int(m.group("number"))
+    else:
+        base, newest = name, 0
+    segments = []
+    STATS.count("dirs listed")
+    try:
+        entries = os.listdir(directory or ".")
+    except OSError:
+        return []
+    for entry in entries:
+        m = ROTATED_RE.match(entry)
+        if m and m.group("base") == base and int(m.group("number")) > newest:
+            segments.append((int(m.group("number")), os.path.join(directory, entry)))
+    return [p for _, p in sorted(segments, reverse=True)]
+
+
+def is_rotated_segment(name, names):
+    """ True if name is a rotated segment of another file in names """
+    m = ROTATED_RE.match(name)
+    return bool(m) and m.group("base") in names
+
+
+def read_head(path, size):
+    """ returns the first size decompressed bytes of path """
+    if not is_compressed(path):
+        with open(path, "rb") as f:
+            return f.read(size)
+    chunks = []
+    length = 0
+    for chunk in iter_chunks(path, chunk_bytes=HEAD_CHUNK_BYTES):
+        chunks.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            break
+    return b"".join(chunks)[:size]
+
+
+def store_index(path, index):
+    """ keep the index of a segment which has been read to its end """
+    with _CACHE_LOCK:
+        _INDICES[segment_key(path)] = index
+        while len(_INDICES) > MAX_CACHED_CHAINS:
+            _INDICES.popitem(last=False)
+
+
+def read_tail(path, size):
+    """ returns the last size decompressed bytes of path. Plain segments are
+    read backwards from their end, gzip segments build their index on the
+    first read and later reads only decompress from the last checkpoints """
+    if not is_compressed(path):
+        with open(path, "rb") as f:
+            end = f.seek(0, os.SEEK_END)
+            f.seek(max(0, end - size), os.SEEK_SET)
+            return f.read(size)
+    key = segment_key(path)
+    with _CACHE_LOCK:
+        index = _INDICES.get(key)
+    if index is not None:
+        return index.read(max(0, index.size - size))
+    index = GzipIndex(path) if path.endswith(".gz") else None
+    data = deque()
+    length = 0
+    for chunk in iter_chunks(path, index):
+        data.append(chunk)
+        length += len(chunk)
+        while length - len(data[0]) >= size:
+            length -= len(data.popleft())
+    if index is not None:
+        store_index(path, index)
+    return b"".join(data)[-size:]
+
+
+def decode_lines(path, parser, tail, start=0, check=b""):
+    """ feed the lines of the segment path from the offset start on to
+    parser and append them to the deque tail, builds the index of gzip
+    segments. The bytes before start must equal check, else nothing is
+    fed and False is returned """
+    if len(check) > start:
+        return False
+    index = GzipIndex(path) if path.endswith(".gz") else None
+    chunks = iter_chunks(path, index, start=start - len(check))
+    data = b""
+    for chunk in chunks:
+        data += chunk
+        if len(data) >= len(check):
+            break
+    if data[:len(check)] != check:
+        chunks.close()
+        return False
+    partial = b""
+    for chunk in itertools.chain((data[len(check):],), chunks):
+        data = partial + chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            partial = data
+            continue
+        partial = data[end+1:]
+        lines = data[:end].decode("utf-8", errors="replace").split("\n")
+        parser.feed(lines)
+        tail.extend(lines)
+    if partial:
+        line = partial.decode("utf-8", errors="replace")
+        parser.feed([line])
+        tail.append(line)
+    if index is not None:
+        store_index(path, index)
+    return True
+
+
+def continue_segment(path, key, resume, parser, tail):
+    """ continue the state of a log at the offset where it has been
+    rotated to path, returns False if path is not the rotated log """
+    if key[0] == resume["inode"] and not is_compressed(path):
+        # renamed, the same file
+        return decode_lines(path, parser, tail, resume["offset"])
+    if not resume["check"]:
+        return False
+    # copied or compressed, the last line read has to be at the offset
+    return decode_lines(path, parser, tail, resume["offset"], resume["check"])
+
+
+def parse_chain(paths, filters=None, max_lines=4000, resume=None):
+    """ returns the LogParser state and the last max_lines lines after all
+    segments of paths, oldest first. Results are cached per chain, a chain
+    which extends a cached one only decodes the new segments. resume is
+    the state of the log before it was rotated to the last segment, see
+    Log.rotation_point, then only the rest of that segment is decoded """
+    keys = tuple(segment_key(p) for p in paths)
+    with _CACHE_LOCK:
+        start = 0
+        cached = None
+        for n in range(len(keys), 0, -1):
+            cached = _CHAINS.get(keys[:n])
+            if cached is not None:
+                _CHAINS.move_to_end(keys[:n])
+                start = n
+                break
+
+    if resume is not None and 0 < len(keys) != start:
+        parser = LogParser.from_record(resume["state"], filters)
+        tail = deque(resume["tail"], maxlen=max_lines)
+        if continue_segment(paths[-1], keys[-1], resume, parser, tail):
+            with _CACHE_LOCK:
+                _CHAINS[keys] = (parser.get_record(), tuple(tail))
+                while len(_CHAINS) > MAX_CACHED_CHAINS:
+                    _CHAINS.popitem(last=False)
+            return parser, list(tail)
+
+    if cached is None:
+        parser = LogParser(filters)
+        tail = deque(maxlen=max_lines)
+    else:
+        parser = LogParser.from_record(cached[0], filters)
+        tail = deque(cached[1], maxlen=max_lines)
+
+    for n in range(start, len(paths)):
+        decode_lines(paths[n], parser, tail)
+        with _CACHE_LOCK:
+            _CHAINS[keys[:n+1]] = (parser.get_record(), tuple(tail))
+            while len(_CHAINS) > MAX_CACHED_CHAINS:
+                _CHAINS.popitem(last=False)
+    return parser, list(tail)
@@ -0,0 +1,175 @@
+""" Counters and timers of foamMon itself, and the --profile report
+
+STATS collects per phase timers (discovery, refreshes, frames) and
+counters (stat calls, bytes read, regex scans, widgets built) from all
+threads. They are coarse grained, e.g. once per refresh and not per line,
+so they are always enabled.
+"""
+import cProfile
+import collections
+import contextlib
+import functools
+import os
+import pstats
+import sys
+import threading
+import time
+
+# seconds between two samples of the collapsed stack profiler
+SAMPLE_INTERVAL = 0.005
+
+
+class Timer():
+    """ number of runs, total and max duration of a phase """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+
+
+class Stats():
+
+    def __init__(self):
+        self.start = time.time()
+        self.counters = collections.Counter()
+        self.timers = collections.defaultdict(Timer)
+        self.lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.timers[name].add(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """ decorator adding the duration of every call to the timer name """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self.lock:
+            self.start = time.time()
+            self.counters.clear()
+            self.timers.clear()
+
+    def format_lines(self):
+        """ returns one line per timer and a line of all counters """
+        with self.lock:
+            elapsed = max(time.time() - self.start, 1e-9)
+            lines = ["{: <16} {: >7} runs {: >9.1f} ms total {: >7.1f} ms max {: >7.1f} ms last".format(
+                        name, t.count, 1000 * t.total, 1000 * t.max, 1000 * t.last)
+                     for name, t in sorted(self.timers.items())]
+            lines.append(", ".join(
+                "{} {} ({:.0f}/s)".format(name, format_count(n), n / elapsed)
+                for name, n in sorted(self.counters.items())))
+        return lines
+
+
+def format_count(n):
+    for unit in ("", "k", "M"):
+        if abs(n) < 1000:
+            return "{:.0f}{}".format(n, unit)
+        n /= 1000
+    return "{:.0f}G".format(n)
+
+
+STATS = Stats()
+
+
+class Profiler():
+    """ profiles all threads until stop, the report format depends on the
+    suffix of path: '.collapsed' or '.folded' write sampled stacks for
+    flamegraph tools, '.txt' a pstats text report and anything else a
+    binary pstats file """
+
+    def __init__(self, path):
+        self.path = path
+        self.collapsed = path.endswith((".collapsed", ".folded"))
+        self.profiles = []
+        self.stacks = collections.Counter()
+        self.running = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.running = True
+        if self.collapsed:
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+            return
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        if sys.version_info < (3, 12):
+            # a profile per thread, from 3.12 on a profile covers all threads
+            threading.setprofile(self.profile_thread)
+        profile.enable()
+
+    def profile_thread(self, frame, event, arg):
+        """ installed in new threads, replaces itself by a cProfile """
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def sample(self):
+        own = threading.get_ident()
+        while self.running:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("{}:{}".format(
+                        os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(SAMPLE_INTERVAL)
+
+    def stop(self):
+        """ stop profiling and write the report """
+        self.running = False
+        if self.collapsed:
+            self.sampler.join()
+            with open(self.path, "w") as f:
+                for stack, n in sorted(self.stacks.items()):
+                    f.write("{} {}\n".format(stack, n))
+            return
+        threading.setprofile(None)
+        self.profiles[0].disable()
+        with self.lock:
+            profiles = list(self.profiles)
+        for profile in profiles:
+            profile.create_stats()
+        # threads which did not run any python code have no stats
+        stats = pstats.Stats(*[p for p in profiles if p.stats])
+        if self.path.endswith(".txt"):
+            with open(self.path, "w") as f:
+                stats.stream = f
+                stats.sort_stats("cumulative").print_stats(50)
+        else:
+            stats.dump_stats(self.path)
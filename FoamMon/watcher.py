@@ -0,0 +1,227 @@
+""" Watchers which report changes of case and log directories
+
+The InotifyWatcher uses the Linux inotify API via ctypes, the PollingWatcher
+is the fallback for other platforms and filesystems. Since it can not tell
+what has changed, every watched directory has to be rescanned on every
+refresh.
+
+inotify only reports changes made by the local kernel, thus directories on
+network filesystems, where solvers usually run on other hosts, are never
+watched and have to be polled.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+import threading
+from collections import namedtuple
+
+from .stats import STATS
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE
+              | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+              | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+# f_type of statfs(2) of filesystems which are changed by other hosts
+NETWORK_FS_TYPES = {
+    0x6969: "nfs",
+    0x517B: "smb",
+    0xFF534D42: "cifs",
+    0xFE534D42: "smb2",
+    0x0BD00BD0: "lustre",
+    0x47504653: "gpfs",
+    0x19830326: "beegfs",
+    0x00C36400: "ceph",
+    0x01161970: "gfs2",
+    0x7461636F: "ocfs2",
+    0x5346414F: "afs",
+    0xAAD7AAEA: "panfs",
+    0x65735546: "fuse",
+}
+
+# large enough for struct statfs of all Linux architectures
+STATFS_SIZE = 256
+
+# kind is one of "modified", "created", "deleted" or "overflow",
+# path is the watched directory and name the entry within it
+Event = namedtuple("Event", ["kind", "path", "name", "is_dir"])
+
+
+class PollingWatcher():
+    """ does not watch anything, every directory is considered changed """
+
+    event_driven = False
+
+    def watch(self, path):
+        return False
+
+    def unwatch(self, path):
+        pass
+
+    def is_watched(self, path):
+        return False
+
+    def events(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher():
+    """ watches directories for created, modified and deleted entries """
+
+    event_driven = True
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self._statfs = libc.statfs
+        self._statfs.argtypes = [ctypes.c_char_p, ctypes.c_void_p]
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+        self.lock = threading.Lock()
+        self.paths = {}  # watch descriptor -> path
+        self.wds = {}  # path -> watch descriptor
+        # directories on network filesystems, which are never watched
+        self.remote = set()
+
+    def filesystem_type(self, path):
+        """ returns the f_type of the filesystem of path, None on errors """
+        buf = ctypes.create_string_buffer(STATFS_SIZE)
+        STATS.count("stat calls")
+        if self._statfs(os.fsencode(path), buf) != 0:
+            return None
+        # the first field, a long on all architectures but s390x
+        return ctypes.c_long.from_buffer(buf).value & 0xFFFFFFFF
+
+    def watch(self, path):
+        """ start watching path, returns False if the watch could not be
+        added, e.g. if fs.inotify.max_user_watches has been reached or
+        path is on a network filesystem """
+        with self.lock:
+            if path in self.wds:
+                return True
+            if path in self.remote:
+                return False
+            if self.filesystem_type(path) in NETWORK_FS_TYPES:
+                self.remote.add(path)
+                return False
+            wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                return False
+            self.paths[wd] = path
+            self.wds[path] = wd
+            return True
+
+    def unwatch(self, path):
+        with self.lock:
+            wd = self.wds.pop(path, None)
+            if wd is not None:
+                self.paths.pop(wd, None)
+                self._rm_watch(self.fd, wd)
+
+    def is_watched(self, path):
+        return path in self.wds
+
+    def read(self):
+        """ returns all pending raw bytes without blocking """
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def events(self):
+        """ returns a list of Events which happened since the last call """
+        buf = self.read()
+        events = []
+        offset = 0
+        with self.lock:
+            while offset < len(buf):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(buf[offset:offset + length].rstrip(b"\0"))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    events.append(Event("overflow", None, None, False))
+                    continue
+
+                path = self.paths.get(wd)
+                if path is None:
+                    continue
+
+                if mask & IN_IGNORED:
+                    # watch removed by the kernel, e.g. directory deleted
+                    self.paths.pop(wd, None)
+                    self.wds.pop(path, None)
+                    continue
+
+                is_dir = bool(mask & IN_ISDIR)
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    events.append(Event("deleted", path, None, True))
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    events.append(Event("created", path, name, is_dir))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    events.append(Event("deleted", path, name, is_dir))
+                elif mask & (IN_MODIFY | IN_CLOSE_WRITE):
+                    events.append(Event("modified", path, name, is_dir))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def get_watcher(kind="auto"):
+    """ returns a watcher of the given kind, 'auto' selects inotify
+    if it is available and falls back to polling otherwise """
+    if kind == "poll":
+        return PollingWatcher()
+    if kind == "auto" and not sys.platform.startswith("linux"):
+        return PollingWatcher()
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError):
+        if kind == "inotify":
+            raise
+        return PollingWatcher()
@@ -0,0 +1,159 @@
+#! /usr/bin/env python3
+""" Synthetic OpenFOAM case trees for the benchmarks
+
+Every case has a system/controlDict, time step directories, optionally
+decomposed processorK directories, a solver log and a blockMesh log. The
+tree only depends on the arguments, thus runs on different machines and
+commits are comparable.
+"""
+import argparse
+import os
+
+# writeControl of the controlDicts, cycled through the cases
+WRITE_CONTROLS = ("timeStep", "runTime", "adjustableRunTime", "clockTime")
+
+CONTROL_DICT = """FoamFile
+{{
+    version     2.0;
+    format      ascii;
+    class       dictionary;
+    location    "system";
+    object      controlDict;
+}}
+
+application     pimpleFoam;
+startFrom       startTime;
+startTime       0;
+stopAt          endTime;
+endTime         {end_time};
+deltaT          {delta_t};
+writeControl    {write_control};
+writeInterval   {write_interval};
+purgeWrite      0;
+runTimeModifiable true;
+
+functions
+{{
+    fieldAverage1
+    {{
+        type            fieldAverage;
+        timeStart       {sampling_start};
+        fields          ( U {{ mean on; prime2Mean on; }} p {{ mean on; }} );
+    }}
+}}
+"""
+
+LOG_HEADER = """/*---------------------------------------------------------------------------*\\
+  =========                 |
+  \\\\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox
+   \\\\    /   O peration     | Website:  https://openfoam.org
+    \\\\  /    A nd           | Version:  8
+     \\\\/     M anipulation  |
+\\*---------------------------------------------------------------------------*/
+Build  : 8-1c9b5879390b
+Exec   : {exec_}
+Date   : Jan 01 2020
+Time   : 10:00:00
+Host   : node01
+PID    : 1234
+I/O    : uncollated
+Case   : {case}
+nProcs : {nprocs}
+
+Starting time loop
+
+"""
+
+STEP = """Courant Number mean: 0.0123 max: 0.{courant:04d}
+deltaT = {delta_t:g}
+Time = {time:g}
+
+PIMPLE: iteration 1
+smoothSolver:  Solving for Ux, Initial residual = {residual:.4g}, Final residual = 1e-07, No Iterations 3
+smoothSolver:  Solving for Uy, Initial residual = {residual:.4g}, Final residual = 1e-07, No Iterations 3
+GAMG:  Solving for p, Initial residual = {residual:.4g}, Final residual = 1e-08, No Iterations 12
+time step continuity errors : sum local = 1.2e-09, global = 3.4e-12, cumulative = 5.6e-11
+ExecutionTime = {clock:.2f} s  ClockTime = {clock:.0f} s
+
+"""
+
+DELTA_T = 0.001
+
+
+def step_text(step):
+    """ returns the log lines of time step number step """
+    return STEP.format(courant=step % 10000, delta_t=DELTA_T, time=step * DELTA_T,
+                       residual=1e-3 / (1 + step % 97), clock=step * 0.5)
+
+
+def write_log(path, case, steps, nprocs=1, first_step=1):
+    with open(path, "w") as f:
+        f.write(LOG_HEADER.format(
+            exec_="pimpleFoam -parallel" if nprocs > 1 else "pimpleFoam",
+            case=case, nprocs=nprocs))
+        for step in range(first_step, first_step + steps):
+            f.write(step_text(step))
+
+
+def append_steps(path, first_step, steps):
+    """ append steps time steps to the log path, like a running solver,
+    returns the number of the next step """
+    with open(path, "a") as f:
+        f.write("".join(step_text(s) for s in range(first_step, first_step + steps)))
+    return first_step + steps
+
+
+def make_case(path, index, time_dirs, processors, log_steps):
+    write_control = WRITE_CONTROLS[index % len(WRITE_CONTROLS)]
+    end_time = 100 * log_steps * DELTA_T
+    write_interval = 100 if write_control == "timeStep" else 100 * DELTA_T
+    os.makedirs(os.path.join(path, "system"))
+    with open(os.path.join(path, "system", "controlDict"), "w") as f:
+        f.write(CONTROL_DICT.format(
+            end_time=end_time, delta_t=DELTA_T, write_control=write_control,
+            write_interval=write_interval, sampling_start=end_time / 2))
+    times = ["{:g}".format(i * 100 * DELTA_T) for i in range(time_dirs)]
+    for t in times:
+        os.makedirs(os.path.join(path, t))
+    for k in range(processors):
+        os.makedirs(os.path.join(path, "processor{}".format(k), "constant"))
+        for t in times:
+            os.makedirs(os.path.join(path, "processor{}".format(k), t))
+    write_log(os.path.join(path, "log.pimpleFoam"), path, log_steps,
+              nprocs=max(1, processors))
+    with open(os.path.join(path, "log.blockMesh"), "w") as f:
+        f.write(LOG_HEADER.format(exec_="blockMesh", case=path, nprocs=1))
+    # the solver log is the most recent log
+    os.utime(os.path.join(path, "log.blockMesh"), (1e9, 1e9))
+
+
+def make_tree(root, cases=100, groups=10, time_dirs=10, processors=0,
+              parallel_every=4, log_steps=1000):
+    """ create cases below root, spread over groups folders, every
+    parallel_every-th case is decomposed into processors directories.
+    root must not exist or be empty. Returns the paths of the solver logs """
+    if os.path.isdir(root) and os.listdir(root):
+        raise FileExistsError("{} is not empty".format(root))
+    logs = []
+    for i in range(cases):
+        path = os.path.join(root, "group{}".format(i % groups), "case{}".format(i))
+        nprocs = processors if parallel_every and i % parallel_every == 0 else 0
+        make_case(path, i, time_dirs, nprocs, log_steps)
+        logs.append(os.path.join(path, "log.pimpleFoam"))
+    return logs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic tree of OpenFOAM cases")
+    parser.add_argument("root", help="Directory of the tree, must not exist or be empty")
+    parser.add_argument("--cases", type=int, default=100, help="Number of cases [default: 100]")
+    parser.add_argument("--groups", type=int, default=10, help="Number of folders the cases are spread over [default: 10]")
+    parser.add_argument("--time-dirs", type=int, default=10, help="Time step directories per case [default: 10]")
+    parser.add_argument("--processors", type=int, default=4, help="processorK directories of decomposed cases [default: 4]")
+    parser.add_argument("--parallel-every", type=int, default=4, help="Every n-th case is decomposed [default: 4]")
+    parser.add_argument("--log-steps", type=int, default=1000, help="Time steps in every solver log [default: 1000]")
+    args = parser.parse_args()
+    if os.path.isdir(args.root) and os.listdir(args.root):
+        parser.error("{} is not empty".format(args.root))
+    make_tree(args.root, args.cases, args.groups, args.time_dirs, args.processors,
+              args.parallel_every, args.log_steps)
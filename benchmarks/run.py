@@ -0,0 +1,316 @@
+#! /usr/bin/env python3
+""" Benchmarks of the hot paths of foamMon
+
+Every benchmark runs on a synthetic tree, see generate.py, and reports the
+median wall time, the file system calls, the bytes read and the peak python
+memory of a single run:
+
+    python benchmarks/run.py --cases 500
+    python benchmarks/run.py --save baseline.json
+    python benchmarks/run.py --compare baseline.json
+
+File system calls are counted by wrapping the os functions foamMon uses
+plus the read syscalls of /proc/self/io, bytes are the bytes read by
+syscalls (rchar), including those served by the page cache. Memory is
+measured in an extra run with tracemalloc, since tracing slows down the
+timed runs.
+"""
+import argparse
+import builtins
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate import append_steps, make_tree  # noqa: E402
+from FoamMon.FoamDataStructures import Cases  # noqa: E402
+from FoamMon.Log import FILE_POOL, Log  # noqa: E402
+
+# os functions counted as file system calls, the os.path functions
+# use os.stat and are counted by it
+WRAPPED = [(os, name) for name in ("stat", "lstat", "fstat", "scandir", "listdir", "open")]
+WRAPPED.append((builtins, "open"))
+
+# a run slower than baseline * (1 + threshold) is reported as regression
+REGRESSION_THRESHOLD = 0.25
+# allowed relative increase of syscalls and bytes read, e.g. by threads
+# of the interpreter
+COUNT_TOLERANCE = 0.05
+# bytes of peak memory which are never reported as regression
+MEMORY_SLACK = 64 * 1024
+
+
+class Counter():
+    """ counts the calls of the WRAPPED functions of all threads """
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.originals = []
+
+    def wrap(self, func):
+        def wrapper(*args, **kwargs):
+            with self.lock:
+                self.calls += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        for module, name in WRAPPED:
+            func = getattr(module, name)
+            self.originals.append((module, name, func))
+            setattr(module, name, self.wrap(func))
+        return self
+
+    def __exit__(self, *exc):
+        for module, name, func in self.originals:
+            setattr(module, name, func)
+        self.originals = []
+
+
+def read_proc_io():
+    """ returns the rchar and syscr of the process, zeros if the kernel
+    does not provide /proc/self/io """
+    try:
+        with open("/proc/self/io") as f:
+            values = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return 0, 0
+    return int(values["rchar"]), int(values["syscr"])
+
+
+def proc_io_overhead():
+    """ returns the rchar and syscr of reading /proc/self/io itself """
+    rchar, syscr = read_proc_io()
+    rchar_end, syscr_end = read_proc_io()
+    return rchar_end - rchar, syscr_end - syscr
+
+
+def measure(setup, repeat):
+    """ run setup() and the returned function repeat times, returns the
+    median wall time, syscalls and bytes read of the runs and the peak
+    memory of an extra traced run """
+    walls, syscalls, reads = [], [], []
+    rchar_overhead, syscr_overhead = proc_io_overhead()
+    for _ in range(repeat):
+        run, teardown = setup()
+        try:
+            rchar, syscr = read_proc_io()
+            with Counter() as counter:
+                start = time.perf_counter()
+                run()
+                walls.append(time.perf_counter() - start)
+            rchar_end, syscr_end = read_proc_io()
+            syscalls.append(counter.calls + max(0, syscr_end - syscr - syscr_overhead))
+            reads.append(max(0, rchar_end - rchar - rchar_overhead))
+        finally:
+            teardown()
+
+    run, teardown = setup()
+    try:
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        teardown()
+    return {
+        "wall": statistics.median(walls),
+        "syscalls": int(statistics.median(syscalls)),
+        "bytes_read": int(statistics.median(reads)),
+        "peak_memory": peak,
+    }
+
+
+class Benchmarks():
+    """ the benchmarks on a tree of cases, every bench_* method returns the
+    function to measure and its teardown """
+
+    def __init__(self, root, logs, append_steps, append_fraction):
+        self.root = root
+        self.logs = logs
+        self.append_steps = append_steps
+        # logs which grow between two refreshes
+        self.growing = logs[:max(1, int(len(logs) * append_fraction))]
+        # log path -> number of the next time step
+        self.next_step = {}
+
+    def append(self):
+        """ append to the growing logs like running solvers """
+        for path in self.growing:
+            step = self.next_step.get(path, 100000)
+            self.next_step[path] = append_steps(path, step, self.append_steps)
+
+    def cases(self, discover=True, refresh=True):
+        cases = Cases([self.root], "poll", background=False)
+        if discover:
+            cases.find_cases()
+        if refresh:
+            cases.get_valid_cases(timeout=None)
+        return cases
+
+    def all_cases(self, cases):
+        return [c for cs in cases.cases.values() for c in cs]
+
+    def bench_find_cases_cold(self):
+        cases = self.cases(discover=False, refresh=False)
+        return cases.find_cases, cases.stop
+
+    def bench_find_cases_warm(self):
+        cases = self.cases(refresh=False)
+        return cases.find_cases, cases.stop
+
+    def bench_get_valid_cases_cold(self):
+        cases = self.cases(refresh=False)
+        return lambda: cases.get_valid_cases(timeout=None), cases.stop
+
+    def bench_get_valid_cases_append(self):
+        cases = self.cases()
+        self.append()
+        # like watcher events, the poll deadlines would delay the refreshes
+        cases.dirty.update(os.path.dirname(path) for path in self.growing)
+        return lambda: cases.get_valid_cases(timeout=None), cases.stop
+
+    def bench_get_valid_cases_idle(self):
+        cases = self.cases()
+        return lambda: cases.get_valid_cases(timeout=None), cases.stop
+
+    def bench_log_refresh(self):
+        logs = [Log(path) for path in self.growing]
+        self.append()
+
+        def run():
+            for log in logs:
+                log.refresh()
+        return run, FILE_POOL.close
+
+    def bench_get_status(self):
+        cases = self.cases()
+        self.append()
+        all_cases = self.all_cases(cases)
+        for c in all_cases:
+            c.refresh()
+
+        def run():
+            for c in all_cases:
+                c.get_status()
+        return run, cases.stop
+
+    def bench_draw(self):
+        from FoamMon import cui
+        cases = self.cases()
+        cases.produce_snapshot()
+        for element in cui.default_elements:
+            cui.COLUMNS[element] = True
+
+        def run():
+            frame = cui.CasesListFrame(cases, hide_inactive=False)
+            frame.draw().render((200, 60), focus=True)
+        return run, cases.stop
+
+    def names(self):
+        names = [n[len("bench_"):] for n in dir(self) if n.startswith("bench_")]
+        return sorted(names, key=lambda n: getattr(type(self), "bench_" + n).__code__.co_firstlineno)
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB"):
+        if abs(n) < 1024:
+            return "{:.0f} {}".format(n, unit)
+        n /= 1024
+    return "{:.1f} GB".format(n)
+
+
+def print_results(results, baseline=None, out=sys.stdout):
+    out.write("{:<24} {:>10} {:>10} {:>10} {:>10}\n".format(
+        "benchmark", "wall [ms]", "syscalls", "read", "peak mem"))
+    for name, r in results.items():
+        line = "{:<24} {:>10.2f} {:>10} {:>10} {:>10}".format(
+            name, r["wall"] * 1000, r["syscalls"],
+            format_bytes(r["bytes_read"]), format_bytes(r["peak_memory"]))
+        if baseline and name in baseline:
+            line += "  {:+.0%}".format(r["wall"] / baseline[name]["wall"] - 1)
+        out.write(line + "\n")
+
+
+def regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """ returns the names of benchmarks which got slower or use more
+    syscalls, bytes or memory than the baseline allows """
+    slower = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+        if r["wall"] > b["wall"] * (1 + threshold):
+            slower.append(name)
+        elif r["peak_memory"] > b["peak_memory"] * (1 + threshold) + MEMORY_SLACK:
+            slower.append(name)
+        elif any(r[key] > b[key] * (1 + COUNT_TOLERANCE) + 16
+                 for key in ("syscalls", "bytes_read")):
+            # these hardly depend on the machine load
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of foamMon on a synthetic case tree")
+    parser.add_argument("--cases", type=int, default=200, help="Number of cases [default: 200]")
+    parser.add_argument("--groups", type=int, default=20, help="Number of folders [default: 20]")
+    parser.add_argument("--time-dirs", type=int, default=10, help="Time step directories per case [default: 10]")
+    parser.add_argument("--processors", type=int, default=4, help="processorK directories of decomposed cases [default: 4]")
+    parser.add_argument("--log-steps", type=int, default=1000, help="Time steps in every solver log [default: 1000]")
+    parser.add_argument("--append-steps", type=int, default=5,
+            help="Time steps appended to a growing log between two refreshes [default: 5]")
+    parser.add_argument("--append-fraction", type=float, default=0.25,
+            help="Fraction of the logs which grow [default: 0.25]")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark [default: 5]")
+    parser.add_argument("--root",
+            help="Directory of the tree, must not exist or be empty [default: a temporary directory]")
+    parser.add_argument("--save", metavar="FILE", help="Store the results as JSON")
+    parser.add_argument("--compare", metavar="FILE",
+            help="Compare with the results of --save, exits with 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+            help="Allowed relative increase of wall time and memory for --compare [default: 0.25]")
+    parser.add_argument("benchmarks", nargs="*", help="Run only these benchmarks")
+    args = parser.parse_args()
+    if args.root and os.path.isdir(args.root) and os.listdir(args.root):
+        parser.error("--root {} is not empty".format(args.root))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.root or os.path.join(tmp, "cases")
+        logs = make_tree(root, args.cases, args.groups, args.time_dirs,
+                         args.processors, log_steps=args.log_steps)
+        benchmarks = Benchmarks(root, logs, args.append_steps, args.append_fraction)
+        results = {}
+        for name in benchmarks.names():
+            if args.benchmarks and name not in args.benchmarks:
+                continue
+            try:
+                results[name] = measure(getattr(benchmarks, "bench_" + name), args.repeat)
+            except ImportError as e:
+                # e.g. draw without urwid
+                sys.stderr.write("skipping {}: {}\n".format(name, e))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+    if baseline is not None:
+        slower = regressions(results, baseline, args.threshold)
+        if slower:
+            print("regressions: " + ", ".join(slower))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import json
+import sqlite3
+
+from FoamMon.cache import StateCache
+from FoamMon.Log import RECORD_SAMPLES, Log
+
+
+def steps(start, stop):
+    return "".join("Courant Number mean: 0.1 max: 0.5\nTime = {}\n"
+                   "ExecutionTime = {} s  ClockTime = {} s\n\n"
+                   .format(t, t, t) for t in range(start, stop))
+
+
+class FakeCase():
+
+    def __init__(self, path, log):
+        self.path = path
+        self.log = log
+        self.log_records = {}
+        self.log_execs = {}
+        self.speed_window = 50
+
+
+def stored_logs(cache):
+    db = sqlite3.connect(cache.path)
+    try:
+        return dict(db.execute("SELECT path, record FROM logs"))
+    finally:
+        db.close()
+
+
+def tamper(cache, path):
+    db = sqlite3.connect(cache.path)
+    with db:
+        db.execute("UPDATE logs SET record = ? WHERE path = ?", ("tampered", path))
+    db.close()
+
+
+def test_records_are_compact(tmp_path):
+    (tmp_path / "a").mkdir()
+    fn = tmp_path / "a" / "log"
+    fn.write_text(steps(1, 500))
+    cache = StateCache(str(tmp_path / "state.sqlite"))
+    cache.save([str(tmp_path)], {}, [FakeCase(str(tmp_path / "a"), Log(str(fn)))])
+
+    record = json.loads(stored_logs(cache)[str(fn)])
+    assert len(record["state"]["history"]["sim"]) == 50
+    assert len(record["state"]["series"]["Co"]) == RECORD_SAMPLES
+    assert record["state"]["series"]["Co"][-1] == 0.5
+    assert record["state"]["sim_time"] == 499
+
+
+def test_save_writes_changed_rows(tmp_path):
+    logs = []
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "log").write_text(steps(1, 10))
+        logs.append(Log(str(tmp_path / name / "log")))
+    cases = [FakeCase(str(tmp_path / n), log) for n, log in zip("ab", logs)]
+    roots = [str(tmp_path)]
+    cache = StateCache(str(tmp_path / "state.sqlite"))
+    cache.save(roots, {}, cases)
+    a, b = (str(log.path) for log in logs)
+    tamper(cache, a)
+    tamper(cache, b)
+
+    with open(b, "a") as f:
+        f.write(steps(10, 11))
+    logs[1].refresh()
+    cache.save(roots, {}, cases)
+    stored = stored_logs(cache)
+    # unchanged logs are not written again
+    assert stored[a] == "tampered"
+    assert json.loads(stored[b])["state"]["sim_time"] == 10
+
+    with open(a, "a") as f:
+        f.write(steps(10, 11))
+    logs[0].refresh()
+    cache.save(roots, {}, cases)
+    assert json.loads(stored_logs(cache)[a])["state"]["sim_time"] == 10
+
+    # a new instance knows the loaded rows
+    cache = StateCache(cache.path)
+    cache.load(roots)
+    tamper(cache, a)
+    cache.save(roots, {}, cases)
+    assert stored_logs(cache)[a] == "tampered"
+    cache.save(roots, {}, cases[1:])
+    assert list(stored_logs(cache)) == [b]
@@ -0,0 +1,51 @@
+import os
+import shutil
+
+from FoamMon.FoamDict import file_keys, parse_file, tokenize
+
+CONTROL_DICT = os.path.join(os.path.dirname(__file__), "fixtures", "case", "system", "controlDict")
+
+
+def test_tokenize():
+    text = 'a 1; // comment\n/* block\ncomment */ b "s t" ${x} (1 2);'
+    assert tokenize(text) == ["a", "1", ";", "b", '"s t"', "${x}", "(", "1", "2", ")", ";"]
+
+
+def test_tokenize_line_directives():
+    text = "#includeFunc patchAverage(patch=inlet, fields=(p U))\n#includeEtc \"a/b\"\nc 1;"
+    assert tokenize(text) == ["c", "1", ";"]
+
+
+def test_parse_file():
+    parsed = parse_file(CONTROL_DICT)
+    assert parsed["FoamFile"]["object"] == "controlDict"
+    assert parsed["application"] == "pimpleFoam"
+    # from the included settings and macros
+    assert parsed["endTime"] == "10"
+    assert parsed["deltaT"] == "0.01"
+    assert parsed["writeInterval"] == "0.5"
+
+
+def test_parse_functions():
+    functions = parse_file(CONTROL_DICT)["functions"]
+    assert list(functions) == ["fieldAverage1"]
+    assert functions["fieldAverage1"]["timeStart"] == "10"
+    assert functions["fieldAverage1"]["fields"] == [
+        "U", {"mean": "on", "prime2Mean": "on"}, "p", {"mean": "on"}]
+
+
+def test_file_keys_of_included_files(tmp_path):
+    system = tmp_path / "system"
+    shutil.copytree(os.path.dirname(CONTROL_DICT), str(system))
+    control_dict = str(system / "controlDict")
+    keys = file_keys(control_dict)
+    assert [k[0] for k in keys] == [control_dict, str(system / "settings")]
+    assert file_keys(control_dict) == keys
+
+    # a change of only the included file changes the keys and the parsed values
+    (system / "settings").write_text("finalTime 20;\ndt 0.01;\n")
+    os.utime(str(system / "settings"), (1000000, 1000000))
+    assert file_keys(control_dict) != keys
+    assert parse_file(control_dict)["endTime"] == "20"
+    assert file_keys(str(system / "missing")) is None
+
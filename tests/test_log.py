@@ -0,0 +1,139 @@
+import os
+import sys
+
+import pytest
+
+from FoamMon.Log import FilePool, Log
+
+
+def steps(start, stop):
+    return "".join("Time = {}\nExecutionTime = {} s  ClockTime = {} s\n\n"
+                   .format(t, t, t) for t in range(start, stop))
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / "log.pimpleFoam"
+    path.write_text(steps(1, 4))
+    return path
+
+
+def test_appended_lines(log_path):
+    log = Log(str(log_path))
+    assert log.state.sim_time == 3
+    with open(str(log_path), "a") as f:
+        f.write(steps(4, 6))
+    log.refresh()
+    assert log.state.sim_time == 5
+    assert list(log.lines) == steps(1, 6).splitlines()
+    assert log.offset == log_path.stat().st_size
+
+
+def test_partial_line(log_path):
+    log = Log(str(log_path))
+    with open(str(log_path), "a") as f:
+        f.write("Time = 1")
+    log.refresh()
+    # the last line is not complete yet
+    assert log.state.sim_time == 3
+    assert log.lines[-1] == ""
+    assert log.partial == b"Time = 1"
+
+    with open(str(log_path), "a") as f:
+        f.write("0\nExecution")
+    log.refresh()
+    assert log.state.sim_time == 10
+    assert log.lines[-1] == "Time = 10"
+    assert log.partial == b"Execution"
+
+
+def test_truncation(log_path):
+    log = Log(str(log_path))
+    inode = log.inode
+    with open(str(log_path), "w") as f:
+        f.write(steps(1, 2))
+    assert log_path.stat().st_ino == inode
+    log.refresh()
+    # the state starts again with the new content
+    assert log.state.sim_time == 1
+    assert log.state.steps == 1
+    assert list(log.lines) == steps(1, 2).splitlines()
+
+
+def test_replaced(log_path, tmp_path):
+    log = Log(str(log_path))
+    new = tmp_path / "new"
+    new.write_text(steps(7, 9) + steps(9, 10))
+    os.replace(str(new), str(log_path))
+    log.refresh()
+    assert log.inode == log_path.stat().st_ino
+    assert log.state.sim_time == 9
+    assert log.state.steps == 3
+    assert list(log.lines) == steps(7, 10).splitlines()
+
+
+def test_file_pool_evicts_least_recently_used(tmp_path):
+    paths = []
+    for n in range(3):
+        paths.append(str(tmp_path / "log{}".format(n)))
+        with open(paths[-1], "w") as f:
+            f.write("log {}\n".format(n))
+    pool = FilePool(max_open=2)
+    with pool.open(paths[0]) as f0:
+        pass
+    with pool.open(paths[1]):
+        pass
+    with pool.open(paths[0]):
+        pass
+    with pool.open(paths[2]):
+        pass
+    # log1 was used least recently
+    assert list(pool.files) == [paths[0], paths[2]]
+    assert not f0.closed
+
+    # files in use are kept open until they are released
+    with pool.open(paths[1]) as f1, pool.open(paths[0]), pool.open(paths[2]):
+        assert len(pool.files) == 3
+        assert f1.read() == b"log 1\n"
+    # log2 is released first, while the others are still in use
+    assert list(pool.files) == [paths[1], paths[0]]
+    pool.close()
+    assert f0.closed and f1.closed
+
+
+def test_offsets_survive_eviction(tmp_path, monkeypatch):
+    pool = FilePool(max_open=2)
+    # FoamMon.Log is also the name of the class
+    monkeypatch.setattr(sys.modules["FoamMon.Log"], "FILE_POOL", pool)
+    paths = [tmp_path / "{}.log".format(n) for n in range(5)]
+    for path in paths:
+        path.write_text(steps(1, 3))
+    logs = [Log(str(path)) for path in paths]
+    assert len(pool.files) <= 2
+
+    for n, path in enumerate(paths):
+        with open(str(path), "a") as f:
+            f.write(steps(3, 4 + n))
+    for log in logs:
+        log.refresh()
+    assert len(pool.files) <= 2
+    for n, (log, path) in enumerate(zip(logs, paths)):
+        # reopened evicted logs continue at their offsets
+        assert log.offset == path.stat().st_size
+        assert log.state.sim_time == 3 + n
+        assert log.state.steps == 3 + n
+        assert list(log.lines) == steps(1, 4 + n).splitlines()
+
+
+def test_priming_changes_lines_version(log_path):
+    record = Log(str(log_path)).get_record()
+    log = Log(str(log_path), record)
+    # restored without reading the tail
+    assert not log.primed and not log.lines
+    version = log.lines_version
+    log.follow()
+    assert log.lines_version != version
+    assert list(log.lines) == steps(1, 4).splitlines()
+    version = log.lines_version
+    log.follow()
+    assert log.lines_version == version
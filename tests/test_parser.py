@@ -0,0 +1,48 @@
+from FoamMon.parser import CustomFilters, LogParser
+
+STEP = """Courant Number mean: 0.01 max: 0.5
+deltaT = 0.001
+Time = 0.1
+
+smoothSolver:  Solving for alpha.water, Initial residual = 0.002, Final residual = 1e-09, No Iterations 2
+smoothSolver:  Solving for Ux, Initial residual = 0.01, Final residual = 1e-07, No Iterations 3
+GAMG:  Solving for p_rgh, Initial residual = 0.3, Final residual = 1e-08, No Iterations 12
+GAMG:  Solving for p_rgh, Initial residual = 0.05, Final residual = 1e-08, No Iterations 8
+ExecutionTime = 1.5 s  ClockTime = 2 s
+"""
+
+
+def parse(text):
+    parser = LogParser()
+    parser.feed(text.splitlines())
+    return parser
+
+
+def test_residuals():
+    parser = parse(STEP)
+    assert {name: s.latest for name, s in parser.residuals.items()} == {
+        "alpha.water": 0.002, "Ux": 0.01, "p_rgh": 0.3}
+    assert parser.max_residual == 0.3
+
+
+def test_values():
+    parser = parse(STEP)
+    assert parser.sim_time == 0.1
+    assert parser.steps == 1
+    assert parser.latest("Co") == 0.5
+    assert parser.latest("deltaT") == 0.001
+    assert parser.clock_time == 2.0
+    assert parser.execution_time == 1.5
+
+
+def test_custom_filters_replace_values():
+    parser = LogParser(CustomFilters({"Co": "max: ([0-9.]+)"}))
+    parser.feed(STEP.splitlines())
+    custom = parser.custom
+    assert custom == {"Co": "0.5"}
+    parser.feed(["Time = 0.2"])
+    assert parser.custom is custom
+    parser.feed(["Courant Number mean: 0.01 max: 0.7"])
+    assert parser.custom == {"Co": "0.7"}
+    # statuses keep referencing the values they were created with
+    assert custom == {"Co": "0.5"}
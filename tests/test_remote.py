@@ -0,0 +1,143 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from FoamMon import remote
+from FoamMon.remote import Agent, RemoteCases
+
+
+def make_record(path, sim_time=1.0, active=True):
+    return {"path": path, "folder": path.rsplit("/", 1)[-1], "logfile": "log",
+            "active": active, "time": sim_time, "progress": sim_time / 10,
+            "sampling": 0, "sim_speed": 0.5, "avg_sim_speed": 0.5,
+            "writeout": 10, "remaining": 20, "remaining_min": 15,
+            "remaining_max": 25}
+
+
+class FakeCase():
+
+    def __init__(self, record):
+        self.record = record
+
+    def get_record(self):
+        return dict(self.record)
+
+
+class FakeStatus():
+
+    def __init__(self, record):
+        self.case = FakeCase(record)
+
+
+class FakeCases():
+    """ the part of Cases used by the Agent, records are set by the test """
+
+    rescan = False
+    rescan_interval = 60
+
+    def __init__(self, records):
+        self.records = records
+
+    def find_cases(self):
+        pass
+
+    def get_valid_cases(self, timeout=None):
+        statuses = tuple(FakeStatus(r) for r in list(self.records.values()))
+        return {}, {"cases": {"active": statuses, "inactive": ()}}
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError("timed out")
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def agent(tmp_path):
+    cases = FakeCases({"/c/a": make_record("/c/a"), "/c/b": make_record("/c/b")})
+    agent = Agent(cases, str(tmp_path / "agent.sock"), interval=0.05)
+    agent.listen()
+    threading.Thread(target=agent.serve, daemon=True).start()
+    yield agent
+    agent.stop()
+
+
+def connect(agent):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(agent.address)
+    return sock, sock.makefile("r")
+
+
+def test_messages(agent):
+    sock, f = connect(agent)
+    with sock:
+        full = json.loads(f.readline())
+        assert full["full"]
+        assert sorted(full["set"]) == ["/c/a", "/c/b"]
+        assert full["set"]["/c/a"]["time"] == 1.0
+
+        agent.cases.records["/c/a"] = make_record("/c/a", sim_time=2.0)
+        delta = json.loads(f.readline())
+        assert not delta["full"]
+        assert delta["set"] == {"/c/a": {"time": 2.0, "progress": 0.2}}
+        assert delta["del"] == []
+
+        del agent.cases.records["/c/b"]
+        removed = json.loads(f.readline())
+        assert removed["set"] == {}
+        assert removed["del"] == ["/c/b"]
+
+
+def test_remote_cases(agent, monkeypatch):
+    monkeypatch.setattr(remote, "RECONNECT_INTERVAL", 0.05)
+    cases = RemoteCases([agent.address])
+    try:
+        def statuses():
+            snapshot = cases.produce_snapshot()
+            return [s for folder in snapshot.case_stats.values()
+                    for s in folder["active"] + folder["inactive"]]
+        wait_for(lambda: len(statuses()) == 2)
+        assert all(s.active for s in statuses())
+        assert statuses()[0].case.path.endswith(":/c/a")
+
+        # unreachable agents keep their cases, shown as inactive
+        agent.stop()
+        wait_for(lambda: not any(s.active for s in statuses()))
+        assert len(statuses()) == 2
+    finally:
+        cases.stop()
+
+
+def test_listen_replaces_only_stale_sockets(tmp_path):
+    path = tmp_path / "agent.sock"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+    agent = Agent(FakeCases({}), str(path))
+    agent.listen()
+    agent.stop()
+    assert not path.exists()
+
+    path.write_text("not a socket")
+    agent = Agent(FakeCases({}), str(path))
+    with pytest.raises(FileExistsError):
+        agent.listen()
+    agent.stop()
+    assert path.read_text() == "not a socket"
+
+
+def test_produce_survives_errors(agent):
+    def fail(timeout=None):
+        raise OSError("hung filesystem")
+    agent.cases.get_valid_cases = fail
+    time.sleep(0.2)
+    version = agent.version
+    time.sleep(0.2)
+    assert agent.version == version
+    del agent.cases.get_valid_cases
+    wait_for(lambda: agent.version > version)
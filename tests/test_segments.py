@@ -0,0 +1,103 @@
+import gzip
+import os
+
+import pytest
+
+from FoamMon import segments
+from FoamMon.Log import Log
+from FoamMon.segments import GzipIndex, read_tail
+
+
+def steps(start, stop):
+    return "".join("Time = {}\nExecutionTime = {} s  ClockTime = {} s\n\n"
+                   .format(t, t, t) for t in range(start, stop))
+
+
+@pytest.fixture
+def starts(monkeypatch):
+    """ the (path, start) of every segment decompressed or read """
+    calls = []
+    iter_chunks = segments.iter_chunks
+
+    def record(path, index=None, chunk_bytes=segments.READ_CHUNK_BYTES, start=0):
+        calls.append((os.path.basename(path), start))
+        return iter_chunks(path, index, chunk_bytes, start)
+    monkeypatch.setattr(segments, "iter_chunks", record)
+    return calls
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_rotation_continues_state(tmp_path, starts, compress):
+    path = tmp_path / "log.pimpleFoam"
+    path.write_text(steps(1, 11))
+    log = Log(str(path))
+    assert log.state.sim_time == 10
+    offset = log.offset
+
+    # the first steps after the last refresh are decoded from the segment
+    with open(str(path), "a") as f:
+        f.write(steps(11, 13))
+    if compress:
+        with open(str(path), "rb") as f, gzip.open(str(tmp_path / "log.pimpleFoam.1.gz"), "wb") as g:
+            g.write(f.read())
+        path.unlink()
+    else:
+        path.rename(tmp_path / "log.pimpleFoam.1")
+    path.write_text(steps(13, 15))
+    log.refresh()
+
+    assert log.state.sim_time == 14
+    assert log.state.steps == 14
+    assert list(log.lines) == steps(1, 15).splitlines()
+    segment = "log.pimpleFoam.1.gz" if compress else "log.pimpleFoam.1"
+    # a copy is checked against the last line read, the empty line of step 10
+    check = len("\n") if compress else 0
+    assert (segment, offset - check) in starts
+    assert (segment, 0) not in starts
+
+
+def test_rotation_of_another_log(tmp_path, starts):
+    path = tmp_path / "log.pimpleFoam"
+    path.write_text(steps(1, 5))
+    log = Log(str(path))
+    (tmp_path / "log.pimpleFoam.1").write_text(steps(1, 3))
+    path.write_text(steps(3, 4))
+    log.refresh()
+    # the last line read is not at the offset, the segment is decoded in full
+    assert ("log.pimpleFoam.1", 0) in starts
+    assert log.state.sim_time == 3
+    assert log.state.steps == 3
+
+
+def test_read_tail(tmp_path, starts, monkeypatch):
+    monkeypatch.setattr(segments, "READ_CHUNK_BYTES", 1024)
+    monkeypatch.setattr(segments, "INDEX_SPAN_BYTES", 8 * 1024)
+    data = steps(1, 2000).encode()
+    plain = tmp_path / "log.1"
+    plain.write_bytes(data)
+    assert read_tail(str(plain), 100) == data[-100:]
+    # plain segments are read backwards from their end
+    assert not starts
+
+    compressed = tmp_path / "log.2.gz"
+    compressed.write_bytes(gzip.compress(data))
+    assert read_tail(str(compressed), 100) == data[-100:]
+    assert read_tail(str(compressed), 20000) == data[-20000:]
+    # the second read starts at the last checkpoint before the tail
+    assert starts[1][1] == len(data) - 20000
+
+
+def test_gzip_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(segments, "READ_CHUNK_BYTES", 1024)
+    monkeypatch.setattr(segments, "INDEX_SPAN_BYTES", 8 * 1024)
+    data = steps(1, 2000).encode()
+    path = tmp_path / "log.1.gz"
+    # concatenated members, e.g. of pigz
+    path.write_bytes(gzip.compress(data[:30000]) + gzip.compress(data[30000:]))
+
+    index = GzipIndex(str(path))
+    assert index.read(50000) == data[50000:]
+    assert index.size == len(data)
+    assert len(index.checkpoints) > 1
+    for start in (0, 100, 8 * 1024, 30000, len(data) - 1, len(data)):
+        assert index.read(start) == data[start:]
@@ -0,0 +1,68 @@
+import datetime
+
+from FoamMon.FoamDataStructures import Status, StatusColumns
+from FoamMon.parser import CustomFilters, LogParser
+
+
+def make_status(folder="case", time=1.0, active=True, custom=None):
+    return Status(None, 0.5, 50, active, folder, "log", time,
+                  datetime.timedelta(seconds=10), datetime.timedelta(seconds=20),
+                  custom=custom)
+
+
+def test_update_widths():
+    columns = StatusColumns()
+    columns.update("/a", make_status("a"))
+    columns.update("/b", make_status("longer_name"))
+    assert len(columns) == 2
+    assert columns.lengths()["folder"] == len("longer_name")
+    assert columns.lengths()["progressbar"] == 50
+
+    # the widest row became narrower
+    columns.update("/b", make_status("bb"))
+    assert columns.lengths()["folder"] == 2
+    columns.update("/a", make_status("a" * 30))
+    assert columns.lengths()["folder"] == 30
+    # a row below the max does not change it
+    columns.update("/b", make_status("b" * 10))
+    assert columns.lengths()["folder"] == 30
+
+
+def test_remove_widths():
+    columns = StatusColumns()
+    columns.update("/a", make_status("a" * 5, active=False))
+    columns.update("/b", make_status("b" * 20, time=123.456))
+    columns.update("/c", make_status("c" * 10))
+    assert columns.lengths()["folder"] == 20
+    assert columns.lengths()["time"] == len("123.456")
+
+    columns.remove("/b")
+    assert columns.lengths()["folder"] == 10
+    assert columns.lengths()["time"] == len("1.0")
+    # the last row was moved into the removed one
+    assert columns.paths == ["/a", "/c"]
+    assert columns.rows == {"/a": 0, "/c": 1}
+    assert columns.active_paths() == ["/c"]
+
+    columns.remove("/c")
+    columns.remove("/a")
+    assert len(columns) == 0
+    assert columns.lengths()["folder"] == 0
+
+
+def test_shared_custom_values():
+    parser = LogParser(CustomFilters({"Co": "max: ([0-9.]+)"}))
+    parser.feed(["Courant Number mean: 0.01 max: 0.5"])
+    first = make_status(custom=parser.custom)
+    columns = StatusColumns()
+    columns.update("/a", first)
+
+    parser.feed(["Courant Number mean: 0.01 max: 0.75"])
+    second = make_status(custom=parser.custom)
+    columns.update("/a", second)
+    # the status of the last snapshot keeps its values
+    assert first.custom == {"Co": "0.5"}
+    assert first.custom_filter("Co") == "0.5"
+    assert second.custom_filter("Co") == "0.75"
+    assert first != second
+    assert second.custom_filter("missing") == "-"
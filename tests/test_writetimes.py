@@ -0,0 +1,98 @@
+import itertools
+import os
+
+from FoamMon.FoamDataStructures import TimeDirs, WriteTimes
+
+# distinct directory mtimes, the resolution of the file system may be coarse
+MTIMES = itertools.count(1000000)
+
+
+def mkdirs(path, *names):
+    for name in names:
+        os.makedirs(os.path.join(str(path), name), exist_ok=True)
+    mtime = next(MTIMES)
+    os.utime(str(path), (mtime, mtime))
+
+
+def rmdirs(path, *names):
+    for name in names:
+        os.rmdir(os.path.join(str(path), name))
+    mtime = next(MTIMES)
+    os.utime(str(path), (mtime, mtime))
+
+
+def test_time_dirs_sorted(tmp_path):
+    mkdirs(tmp_path, "0.3", "0", "1e-05", "0.25", "constant", "0.orig")
+    (tmp_path / "0.5").write_text("a file, no time step")
+    d = TimeDirs(str(tmp_path))
+    assert d.refresh()
+    assert d.times == [0, 1e-05, 0.25, 0.3]
+    assert d.latest == 0.3
+    assert 1e-05 in d
+    assert not d.refresh()
+
+    mkdirs(tmp_path, "0.1", "2")
+    assert d.refresh()
+    assert d.times == [0, 1e-05, 0.1, 0.25, 0.3, 2]
+    rmdirs(tmp_path, "2", "1e-05")
+    d.refresh()
+    assert d.times == [0, 0.1, 0.25, 0.3]
+    assert 1e-05 not in d
+
+
+def test_time_dirs_duplicate_times(tmp_path):
+    # names of the same time, e.g. written with different precisions
+    mkdirs(tmp_path, "0.1", "0.10", "1e-1")
+    d = TimeDirs(str(tmp_path))
+    d.refresh()
+    assert d.times == [0.1, 0.1, 0.1]
+    rmdirs(tmp_path, "0.10")
+    d.refresh()
+    assert d.times == [0.1, 0.1]
+    rmdirs(tmp_path, "0.1", "1e-1")
+    d.refresh()
+    assert d.times == []
+    assert d.latest == 0
+
+
+def test_write_times_serial(tmp_path):
+    mkdirs(tmp_path, "0", "0.5", "system")
+    w = WriteTimes(str(tmp_path))
+    w.refresh()
+    assert w.latest == w.latest_complete == 0.5
+    assert w.is_complete
+    assert w.processors == []
+
+
+def test_write_times_decomposed(tmp_path):
+    mkdirs(tmp_path, "0", "processor0", "processor1", "processor2")
+    for n in range(3):
+        mkdirs(tmp_path / "processor{}".format(n), "0", "0.1")
+    w = WriteTimes(str(tmp_path))
+    w.refresh()
+    assert w.processors == ["processor0", "processor1", "processor2"]
+    assert w.latest == w.latest_complete == 0.1
+
+    # processor1 is still writing 0.2
+    mkdirs(tmp_path / "processor0", "0.2")
+    mkdirs(tmp_path / "processor2", "0.2")
+    w.refresh()
+    assert w.latest == 0.2
+    assert w.latest_complete == 0.1
+    assert not w.is_complete
+
+    # the other processors are listed again until the time step is complete
+    mkdirs(tmp_path / "processor1", "0.2")
+    w.refresh()
+    assert w.latest_complete == 0.2
+    assert w.is_complete
+
+
+def test_write_times_collated(tmp_path):
+    mkdirs(tmp_path, "processors4_0-1", "processors4_2-3")
+    mkdirs(tmp_path / "processors4_0-1", "1e-05", "2e-05")
+    mkdirs(tmp_path / "processors4_2-3", "1e-05")
+    w = WriteTimes(str(tmp_path))
+    w.refresh()
+    assert w.latest == 2e-05
+    assert w.latest_complete == 1e-05